@@ -0,0 +1,253 @@
+# SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Separation benchmark harness. Generates synthetic multi-stem mixes locally
+and times model load, separation and encoding across models, stem modes,
+export formats, thread counts, segment/overlap settings and inference
+backends. Results are written as JSON so runs can be compared between
+releases and hosts.
+
+    python benchmarks/bench_separation.py --models htdemucs htdemucs_ft \\
+        --threads 4 8 --formats mp3 wav --duration 30 --output bench.json
+
+With `--backends float32 int8`, every non-float32 run also reports the SDR
+of its stems against the float32 stems of the same settings, so speed and
+accuracy can be traded off on measured numbers.
+
+Only weights already present in the model cache (or downloadable by Demucs
+on first use) are needed; no audio is downloaded.
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import psutil
+import soundfile
+import torch
+
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent / "src"))
+
+from config import APP_VERSION, INFERENCE_BACKENDS, MODEL_NAME  # noqa: E402
+from audio_processor import ModelPool, load_track, restrict_to_stem  # noqa: E402
+from demucs.apply import apply_model  # noqa: E402
+from demucs.audio import save_audio  # noqa: E402
+from metrics import PeakRSS  # noqa: E402
+from utils import setup_environment  # noqa: E402
+
+FORMAT_SUFFIX = {"mp3": ".mp3", "wav": ".wav", "flac": ".flac"}
+
+
+def synth_mix(seconds: float, samplerate: int = 44100, seed: int = 0) -> np.ndarray:
+    """
+    Build a deterministic stereo mix of four synthetic stems: a vibrato
+    "voice", noise-burst drums, a sub bass line and sustained chords.
+
+    Returns:
+        Array of shape (frames, 2)
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * samplerate)) / samplerate
+
+    vibrato = 5 * np.sin(2 * np.pi * 5.5 * t)
+    voice = sum(
+        np.sin(2 * np.pi * k * (220 + vibrato) * t) / k for k in range(1, 6)
+    ) * (0.5 + 0.5 * np.sin(2 * np.pi * 0.25 * t))
+
+    beat = (t * 2) % 1
+    drums = rng.standard_normal(t.shape) * np.exp(-30 * beat)
+
+    bass_notes = np.array([55, 55, 73.4, 65.4])[(t // 2).astype(int) % 4]
+    bass = np.sin(2 * np.pi * np.cumsum(bass_notes) / samplerate)
+
+    chords = sum(np.sin(2 * np.pi * f * t) for f in (261.6, 329.6, 392.0)) / 3
+
+    left = 0.3 * voice + 0.35 * drums + 0.4 * bass + 0.25 * chords
+    right = 0.3 * voice + 0.25 * drums + 0.4 * bass + 0.35 * chords
+    mix = np.stack([left, right], axis=1)
+    return (0.8 * mix / np.abs(mix).max()).astype(np.float32)
+
+
+def sdr(reference: torch.Tensor, estimate: torch.Tensor) -> float:
+    """Signal-to-distortion ratio of `estimate` against `reference`, in dB"""
+    signal = reference.double().pow(2).sum()
+    error = (reference - estimate).double().pow(2).sum()
+    return round(10 * torch.log10((signal + 1e-8) / (error + 1e-8)).item(), 2)
+
+
+def bench_case(
+    mix_path: Path,
+    duration: float,
+    model_name: str,
+    stems: str,
+    fmt: str,
+    threads: int,
+    segment: float,
+    overlap: float,
+    device: str,
+    out_dir: Path,
+    backend: str = "float32",
+    compile: bool = False,
+    reference: dict = None,
+):
+    """
+    Time one configuration from a cold model load to encoded stems
+
+    Args:
+        reference: Stems of the float32 backend for the same settings; when
+            given, the SDR of this run's stems against them is reported
+
+    Returns:
+        Tuple of (result row, separated stems)
+    """
+    torch.set_num_threads(threads)
+    pool = ModelPool()
+
+    with PeakRSS() as rss:
+        started = time.perf_counter()
+        model = pool.get(model_name, device, backend=backend, compile=compile)
+        load_time = time.perf_counter() - started
+
+        # Two-stem runs only use the sub-models behind the target, as the app does
+        run_model = restrict_to_stem(model, "vocals") if stems == "vocals" else model
+        wav = load_track(mix_path, model.audio_channels, model.samplerate)
+        ref = wav.mean(0)
+        # Same random shifts for every backend, so SDR only reflects the backend
+        random.seed(0)
+        torch.manual_seed(0)
+        started = time.perf_counter()
+        sources = apply_model(
+            run_model,
+            ((wav - ref.mean()) / ref.std())[None],
+            device=device,
+            overlap=overlap,
+            segment=segment,
+        )[0]
+        separate_time = time.perf_counter() - started
+        sources = dict(zip(model.sources, sources * ref.std() + ref.mean()))
+
+        if stems == "vocals":
+            vocals = sources["vocals"]
+            sources = {"vocals": vocals, "no_vocals": wav - vocals}
+
+        started = time.perf_counter()
+        for name, source in sources.items():
+            save_audio(
+                source.cpu(),
+                str(out_dir / f"{name}{FORMAT_SUFFIX[fmt]}"),
+                samplerate=model.samplerate,
+            )
+        encode_time = time.perf_counter() - started
+
+    total = load_time + separate_time + encode_time
+    result = {
+        "model": model_name,
+        "backend": backend,
+        "compiled": compile,
+        "stems": stems,
+        "format": fmt,
+        "threads": threads,
+        "segment": segment,
+        "overlap": overlap,
+        "device": device,
+        "audio_seconds": duration,
+        "load_seconds": round(load_time, 3),
+        "separate_seconds": round(separate_time, 3),
+        "encode_seconds": round(encode_time, 3),
+        "real_time_factor": round((separate_time + encode_time) / duration, 4),
+        "throughput_x": round(duration / total, 3),
+        "peak_rss_mb": round(rss.peak / 1024**2, 1),
+    }
+    if reference is not None:
+        scores = {name: sdr(reference[name], source) for name, source in sources.items()}
+        result["sdr_vs_float32"] = scores
+        result["mean_sdr_vs_float32"] = round(sum(scores.values()) / len(scores), 2)
+    return result, sources
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark Sol stem separation")
+    parser.add_argument("--models", nargs="+", default=MODEL_NAME[:1])
+    parser.add_argument("--stems", nargs="+", choices=("all", "vocals"), default=["all"])
+    parser.add_argument("--formats", nargs="+", choices=tuple(FORMAT_SUFFIX), default=["mp3"])
+    parser.add_argument("--threads", nargs="+", type=int, default=[os.cpu_count() or 1])
+    parser.add_argument("--segments", nargs="+", type=float, default=[None])
+    parser.add_argument("--overlaps", nargs="+", type=float, default=[0.25])
+    parser.add_argument(
+        "--backends", nargs="+", choices=INFERENCE_BACKENDS, default=["float32"],
+        help="Inference backends; float32 always runs first as the SDR reference",
+    )
+    parser.add_argument("--compile", action="store_true", help="Compile the model graphs")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--duration", type=float, default=30.0, help="Mix length in seconds")
+    parser.add_argument("--output", type=Path, help="Write JSON here instead of stdout")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = get_parser().parse_args(argv)
+    setup_environment()
+
+    results = []
+    # Keep stdout clean for the JSON report
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(sys.stderr):
+        tmp = Path(tmp)
+        mix_path = tmp / "mix.wav"
+        soundfile.write(str(mix_path), synth_mix(args.duration), 44100)
+
+        backends = ["float32"] + [b for b in args.backends if b != "float32"]
+        references = {}
+        grid = itertools.product(
+            args.models, args.stems, args.formats, args.threads, args.segments, args.overlaps,
+            backends,
+        )
+        for model_name, stems, fmt, threads, segment, overlap, backend in grid:
+            print(
+                f"{model_name} stems={stems} fmt={fmt} threads={threads} "
+                f"segment={segment} overlap={overlap} backend={backend}",
+                file=sys.stderr,
+            )
+            settings = (model_name, stems, segment, overlap)
+            result, sources = bench_case(
+                mix_path, args.duration, model_name, stems, fmt,
+                threads, segment, overlap, args.device, tmp,
+                backend=backend,
+                compile=args.compile,
+                reference=references.get(settings) if backend != "float32" else None,
+            )
+            if backend == "float32":
+                references[settings] = sources
+            if backend in args.backends:
+                results.append(result)
+
+    report = {
+        "version": APP_VERSION,
+        "host": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cores": os.cpu_count(),
+            "memory_gb": round(psutil.virtual_memory().total / 1024**3, 1),
+            "torch": torch.__version__,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text, encoding="utf-8")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
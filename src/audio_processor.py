@@ -1,65 +1,840 @@
 # SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
 # SPDX-License-Identifier: Apache-2.0
 
+import argparse
 import sys
+import subprocess
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from collections import OrderedDict, deque
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, List
+import numpy as np
 import torch
-from config import LOG_BUFFER_SIZE
-from demucs.separate import main as demucs_main
+import soundfile
+from config import (
+    LOG_BUFFER_SIZE,
+    MODEL_POOL_MEMORY_MB,
+    DECODE_CHUNK_FRAMES,
+    STREAMING_MIN_SECONDS,
+    STREAM_SEGMENT_SECONDS,
+    STREAM_OVERLAP_SECONDS,
+    PREVIEW_SECONDS,
+    PREVIEW_BITRATE,
+    DEFAULT_SEGMENT_SECONDS,
+    MIN_SEGMENT_SECONDS,
+    SKIP_SILENCE,
+    SKIP_DUPLICATES,
+    INFERENCE_BACKENDS,
+)
+from result_cache import ResultCache, result_cache, hash_stream, cache_key
+from demucs.apply import BagOfModels, apply_model
+from demucs.audio import AudioFile, convert_audio, save_audio
+from demucs.separate import get_parser
+from backends import compile_model, load_model
+from batching import batch_session, enable_batching
+from encoder import encoder_pool, export_paths, export_stems, export_variant, when_all, wait_all
+from manifest import (
+    MANIFEST_NAME,
+    manifest_stems,
+    new_manifest,
+    read_manifest,
+    record_export,
+    record_thumbnails,
+    write_manifest,
+)
+from planner import chunk_threads, plan_separation, is_out_of_memory, supports_segment_override
+from progress import RateLimiter, record_phase, get_phase_timings, format_timings
+from silence import plan_skips, separate_active
+from streaming import read_segment, separate_streaming, track_duration
+from thumbnails import compute_thumbnails
 
 torch.classes.__path__ = []
 
-def execute_demucs(command: list[str], log_container) -> None:
+
+class ModelPool:
+    """
+    Process-wide registry of loaded separation models, keyed by model name
+    and device. Models stay resident between jobs and the least recently
+    used ones are evicted once the memory budget is exceeded.
+    """
+
+    def __init__(self, memory_budget_mb: int = MODEL_POOL_MEMORY_MB):
+        self.memory_budget = memory_budget_mb * 1024**2
+        self._models = OrderedDict()
+        # Loads in progress, so concurrent requests for a key share one load
+        self._loading = {}
+        self._lock = threading.RLock()
+
+    def get(
+        self,
+        name: str,
+        device: str = "cpu",
+        repo: Path = None,
+        backend: str = "float32",
+        compile: bool = False,
+    ):
+        """Return a warm model, loading it on first use
+
+        Args:
+            backend: Inference backend (see `backends.load_model`)
+            compile: Compile the model graph on load
+        """
+        if backend != "float32" and device != "cpu":
+            print(f"The {backend} backend only runs on the CPU, using float32 on {device}")
+            backend = "float32"
+        key = (name, device, str(repo) if repo else None, backend, compile)
+        label = name if backend == "float32" else f"{name} ({backend})"
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                print(f"Using resident model {label} on {device}")
+                return self._models[key][0]
+            loading = self._loading.get(key)
+            if loading is None:
+                loading = self._loading[key] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            print(f"Waiting for model {label} on {device} to finish loading")
+            return loading.result()
+
+        # Loaded outside the lock so lookups of other models are not held up
+        print(f"Loading model {label} on {device}")
+        try:
+            model = load_model(name, device, repo, backend)
+            model.to(device)
+            model.eval()
+            if compile:
+                compile_model(model)
+            enable_batching(model)
+            size = model_memory_bytes(model)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            loading.set_exception(e)
+            raise
+
+        with self._lock:
+            self._models[key] = (model, size)
+            del self._loading[key]
+            self._evict(keep=key)
+        loading.set_result(model)
+        return model
+
+    def clear(self) -> None:
+        """Drop every resident model"""
+        with self._lock:
+            self._models.clear()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    @property
+    def memory_used(self) -> int:
+        return sum(size for _, size in self._models.values())
+
+    def _evict(self, keep) -> None:
+        evicted = False
+        while self.memory_used > self.memory_budget and len(self._models) > 1:
+            key = next(k for k in self._models if k != keep)
+            del self._models[key]
+            print(f"Evicted model {key[0]} on {key[1]} from pool")
+            evicted = True
+        if evicted and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+def _tensor_bytes(value, seen: set) -> int:
+    if isinstance(value, torch.Tensor):
+        if value.data_ptr() in seen:
+            return 0
+        seen.add(value.data_ptr())
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(_tensor_bytes(item, seen) for item in value)
+    if isinstance(value, torch.ScriptObject):
+        # Packed weights of dynamically quantised Linear/LSTM layers
+        try:
+            return _tensor_bytes(value.__getstate__(), seen)
+        except RuntimeError:
+            return 0
+    return 0
+
+
+def model_memory_bytes(model: torch.nn.Module) -> int:
+    """Approximate resident size of a model's weights and buffers, including
+    the packed weights of quantised layers, which are not parameters"""
+    seen = set()
+    return sum(_tensor_bytes(value, seen) for value in model.state_dict().values())
+
+
+def restrict_to_stem(model, stem: str):
     """
-    Executes the Demucs audio separation tool with specified arguments,
-    redirecting stdout/stderr to a log container for real-time monitoring.
+    Bag of only the sub-models that contribute to `stem`. Fine-tuned bags
+    such as htdemucs_ft hold one specialist per source, so a two-stem split
+    needs a single forward pass instead of one per source. Only the `stem`
+    output of the returned model is meaningful.
     """
-    args = command[1:]  # Skip executable path/name
+    if not isinstance(model, BagOfModels):
+        return model
+    index = model.sources.index(stem)
+    picked = [(sub, weights) for sub, weights in zip(model.models, model.weights) if weights[index]]
+    if len(picked) == len(model.models):
+        return model
+    # Unit weights elsewhere keep apply_model's per-source normalisation defined
+    weights = [
+        [weight if k == index else 1.0 for k, weight in enumerate(weights)]
+        for _, weights in picked
+    ]
+    return BagOfModels([sub for sub, _ in picked], weights)
+
+
+model_pool = ModelPool()
+
+
+def load_wav_chunked(
+    track: Path, audio_channels: int, samplerate: int, chunk_frames: int = DECODE_CHUNK_FRAMES
+) -> torch.Tensor:
+    """
+    Decode a WAV file block by block straight into a preallocated tensor,
+    avoiding the intermediate whole-file buffers of a one-shot read.
+    """
+    with soundfile.SoundFile(str(track)) as f:
+        wav = torch.empty(f.channels, f.frames, dtype=torch.float32)
+        block = np.empty((chunk_frames, f.channels), dtype=np.float32)
+        offset = 0
+        while offset < f.frames:
+            read = f.read(chunk_frames, dtype="float32", always_2d=True, out=block)
+            wav[:, offset:offset + len(read)] = torch.from_numpy(read.T)
+            offset += len(read)
+        source_rate, source_channels = f.samplerate, f.channels
+
+    if source_rate == samplerate and source_channels == audio_channels:
+        return wav
+    return convert_audio(wav, source_rate, samplerate, audio_channels)
+
+
+def load_track(track: Path, audio_channels: int, samplerate: int) -> torch.Tensor:
+    """Decode a track with FFmpeg, falling back to libsndfile when unavailable"""
+    if track.suffix.lower() == ".wav":
+        return load_wav_chunked(track, audio_channels, samplerate)
+    try:
+        return AudioFile(track).read(
+            streams=0, samplerate=samplerate, channels=audio_channels
+        )
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        data, source_rate = soundfile.read(str(track), dtype="float32", always_2d=True)
+        wav = torch.from_numpy(data.T.copy())
+        return convert_audio(wav, source_rate, samplerate, audio_channels)
+
+
+def separate_tracks(args, encode_futures: list = None) -> List[Path]:
+    """
+    Runs separation for parsed Demucs arguments against a pooled model,
+    mirroring the output layout of `demucs.separate.main`. Stems are handed
+    to the encoder pool so encoding of one track overlaps the separation of
+    the next.
+
+    Args:
+        args: Parsed separation arguments
+        encode_futures: When given, pending encodes are appended here and
+            left running; otherwise they are awaited before returning
+
+    Returns:
+        List of written stem paths in the primary format
+    """
+    args.device = resolve_device(args.device)
+
+    def load_run_model(device: str):
+        model = model_pool.get(args.name, device, args.repo, args.backend, args.compile)
+        return restrict_to_stem(model, args.stem) if args.stem is not None else model
+
+    with record_phase("model_load"):
+        model = model_pool.get(args.name, args.device, args.repo, args.backend, args.compile)
+    if args.stem is not None and args.stem not in model.sources:
+        raise ValueError(
+            f'Stem "{args.stem}" is not in selected model. '
+            f"STEM must be one of {', '.join(model.sources)}."
+        )
+
+    out = args.out / args.name
+    out.mkdir(parents=True, exist_ok=True)
+    print(f"Separated tracks will be stored in {out.resolve()}")
+
+    ext = "mp3" if args.mp3 else "flac" if args.flac else "wav"
+    save_kwargs = {
+        "samplerate": model.samplerate,
+        "bitrate": args.mp3_bitrate,
+        "preset": args.mp3_preset,
+        "clip": args.clip_mode,
+        "as_float": args.float32,
+        "bits_per_sample": 24 if args.int24 else 16,
+    }
+
+    apply_kwargs = {
+        "device": args.device,
+        "shifts": args.shifts,
+        "split": args.split,
+        "overlap": args.overlap,
+        "num_workers": args.jobs,
+        "segment": args.segment,
+    }
+    stem_names = list(model.sources)
+    run_model = model
+    if args.stem is not None:
+        stem_names = [args.stem, f"no_{args.stem}"]
+        # The complement is mix minus target, so other sources are not needed
+        run_model = restrict_to_stem(model, args.stem)
+        if run_model is not model:
+            print(f"Running {len(run_model.models)}/{len(model.models)} sub-models for {args.stem}")
+
+    written = []
+    pending = []
+    for track in args.tracks:
+        if not track.exists():
+            print(f"File {track} does not exist.", file=sys.stderr)
+            continue
+        print(f"Separating track {track}")
+
+        def stem_path(template: str, name: str) -> Path:
+            return out / template.format(
+                track=track.name.rsplit(".", 1)[0],
+                trackext=track.name.rsplit(".", 1)[-1],
+                stem=name,
+                ext=ext,
+            )
+
+        stem_paths = {name: stem_path(args.filename, name) for name in stem_names}
+        # Lossless float32 copies that later format conversions start from
+        intermediates = {}
+        if args.intermediate:
+            intermediates = {name: stem_path(args.intermediate, name) for name in stem_names}
+        for path in [*stem_paths.values(), *intermediates.values()]:
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+        duration = track_duration(track)
+        if duration > STREAMING_MIN_SECONDS:
+            # Long recordings are separated and written segment by segment
+            print(f"Streaming separation in {STREAM_SEGMENT_SECONDS}s segments")
+            outputs = {path: name for name, path in stem_paths.items()}
+            checkpoint = None
+            if intermediates:
+                # Only the memory-mapped intermediates can be resumed after a
+                # crash; encodes are made from them once the track is done
+                outputs = {path: name for name, path in intermediates.items()}
+                checkpoint = next(iter(intermediates.values())).parent / (
+                    f"{track.stem}.checkpoint.npz"
+                )
+            with batch_session(run_model), record_phase("streaming"):
+                separate_streaming(
+                    run_model,
+                    track,
+                    outputs,
+                    STREAM_SEGMENT_SECONDS,
+                    STREAM_OVERLAP_SECONDS,
+                    writer_kwargs={
+                        key: save_kwargs[key]
+                        for key in ("bitrate", "preset", "bits_per_sample", "as_float")
+                    },
+                    skip_silence=args.skip_silence,
+                    skip_duplicates=args.skip_duplicates,
+                    checkpoint=checkpoint,
+                    apply=lambda model, mix, **kwargs: apply_with_fallback(
+                        model, args.name, mix, kwargs, load_run_model
+                    ),
+                    progress=False,
+                    **apply_kwargs,
+                )
+            if intermediates:
+                with record_phase("encode_submit"):
+                    for name, path in intermediates.items():
+                        pending.append(encoder_pool.submit(path, stem_paths[name], save_kwargs))
+            written += stem_paths.values()
+        else:
+            with record_phase("decode"):
+                wav = load_track(track, model.audio_channels, model.samplerate)
+            duration = wav.shape[-1] / model.samplerate
+            plan = None
+            if args.skip_silence:
+                with record_phase("silence_scan"):
+                    plan = plan_skips(wav, model.samplerate, args.skip_duplicates)
+            mix = wav
+            ref = wav.mean(0)
+            wav = (wav - ref.mean()) / ref.std()
+            with batch_session(run_model), record_phase("separate"):
+                if plan and plan["skipped"]:
+                    print(
+                        f"Skipping {plan['skipped'] / model.samplerate:.1f}s of silent "
+                        f"or repeated audio ({len(plan['runs'])} regions to separate)"
+                    )
+                    sources = separate_active(
+                        lambda part: apply_with_fallback(
+                            run_model, args.name, part[None], apply_kwargs, load_run_model
+                        )[0],
+                        wav,
+                        plan,
+                        len(model.sources),
+                    )
+                else:
+                    sources = apply_with_fallback(
+                        run_model, args.name, wav[None], apply_kwargs, load_run_model
+                    )[0]
+            sources = sources * ref.std() + ref.mean()
+
+            stems = dict(zip(model.sources, sources))
+            if args.stem is not None:
+                target = stems[args.stem]
+                stems = {args.stem: target, f"no_{args.stem}": mix - target}
+
+            with record_phase("encode_submit"):
+                for name, source in stems.items():
+                    if name in intermediates:
+                        np.save(intermediates[name], source.cpu().t().contiguous().numpy())
+                        # The worker reads the saved array instead of a pickled copy
+                        source = intermediates[name]
+                    pending.append(encoder_pool.submit(source, stem_paths[name], save_kwargs))
+                    written.append(stem_paths[name])
+
+        if args.manifest:
+            manifest_path = stem_path(args.manifest, "")
+            write_manifest(
+                manifest_path,
+                new_manifest(
+                    args.name,
+                    track.name,
+                    model.samplerate,
+                    model.audio_channels,
+                    duration,
+                    intermediates,
+                    root=manifest_path.parent,
+                    timings=get_phase_timings(),
+                ),
+            )
+
+    if encode_futures is not None:
+        encode_futures.extend(pending)
+    else:
+        with record_phase("encode"):
+            wait_all(pending)
+
+    timings = get_phase_timings()
+    if timings:
+        print(f"Timings: {format_timings(timings)}")
+    return written
+
+
+class _ChunkExecutor(ThreadPoolExecutor):
+    """
+    Thread pool that runs every chunk with its share of the intra-op
+    threads. The count is set and restored around each chunk rather than
+    once per thread, since threads started while it is lowered (such as a
+    batching dispatcher) inherit it.
+    """
+
+    def __init__(self, jobs: int, threads: int):
+        super().__init__(jobs)
+        self.threads = threads
+        self.restore = torch.get_num_threads()
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(self._run_chunk, fn, *args, **kwargs)
+
+    def _run_chunk(self, fn, *args, **kwargs):
+        torch.set_num_threads(self.threads)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            torch.set_num_threads(self.restore)
+
+
+@contextmanager
+def chunk_pool(jobs: int, device: str):
+    """
+    Thread pool for the parallel chunks of one `apply_model` call on the
+    CPU, limiting each chunk to its share of the cores instead of using all
+    of them. Yields None when chunks are not run in parallel.
+    """
+    if not jobs or jobs < 2 or device != "cpu":
+        yield None
+        return
+
+    pool = _ChunkExecutor(jobs, chunk_threads(jobs, torch.get_num_threads()))
+    try:
+        yield pool
+    finally:
+        pool.shutdown()
+
+
+def apply_with_fallback(
+    model, model_name: str, mix: torch.Tensor, apply_kwargs: dict, reload: Callable = None
+):
+    """
+    Run `apply_model`, stepping down on out-of-memory errors: first to
+    sequential chunks, then to halved segments (for models that honour
+    them), and finally from CUDA to the CPU.
+
+    Args:
+        reload: Returns the model to run on a given device, with the same
+            stem restriction and backend; defaults to the pooled model
+    """
+    kwargs = {"progress": True, **apply_kwargs}
+    while True:
+        try:
+            # A fresh pool per call, as apply_model shuts it down when a chunk fails
+            with chunk_pool(kwargs.get("num_workers"), str(kwargs.get("device", "cpu"))) as pool:
+                return apply_model(model, mix, **kwargs, **({"pool": pool} if pool else {}))
+        except (MemoryError, RuntimeError) as e:
+            if not is_out_of_memory(e):
+                raise
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+            segment = kwargs.get("segment") or DEFAULT_SEGMENT_SECONDS
+            if kwargs.get("num_workers"):
+                kwargs["num_workers"] = 0
+                print("Out of memory, retrying with sequential chunks")
+            elif supports_segment_override(model_name) and segment > MIN_SEGMENT_SECONDS:
+                kwargs["segment"] = max(MIN_SEGMENT_SECONDS, segment // 2)
+                print(f"Out of memory, retrying with {kwargs['segment']}s segments")
+            elif str(kwargs.get("device", "cpu")).startswith("cuda"):
+                kwargs["device"] = "cpu"
+                model = reload("cpu") if reload else model_pool.get(model_name, "cpu")
+                print("Out of GPU memory, retrying on the CPU")
+            else:
+                raise
+
+
+_log_target = threading.local()
+
+
+class ThreadRoutedStream:
+    """Stream that forwards writes to the current thread's logger, if any"""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def write(self, data):
+        logger = getattr(_log_target, "logger", None)
+        return (logger or self.fallback).write(data)
+
+    def flush(self):
+        logger = getattr(_log_target, "logger", None)
+        (logger or self.fallback).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.fallback, name)
+
+
+def _install_thread_routing() -> None:
+    if not isinstance(sys.stdout, ThreadRoutedStream):
+        sys.stdout = ThreadRoutedStream(sys.stdout)
+    if not isinstance(sys.stderr, ThreadRoutedStream):
+        sys.stderr = ThreadRoutedStream(sys.stderr)
+
+
+def get_separation_parser():
+    """Demucs argument parser extended with intermediate/manifest outputs and skipping"""
+    parser = get_parser()
+    parser.add_argument(
+        "--intermediate",
+        default=None,
+        help="Also keep every stem as a float32 .npy array at this filename "
+        "template (same fields as --filename) for later format conversions",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="Write a JSON manifest per track (stems, intermediates, duration, "
+        "model, timings) at this filename template, relative to the output folder",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=INFERENCE_BACKENDS,
+        default="float32",
+        help="Inference backend; int8 uses dynamically quantised weights on the CPU",
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="Compile the model graph with torch.compile before separating",
+    )
+    parser.add_argument(
+        "--skip-silence",
+        action=argparse.BooleanOptionalAction,
+        default=SKIP_SILENCE,
+        help="Only run the model on non-silent regions and leave silence in the stems",
+    )
+    parser.add_argument(
+        "--skip-duplicates",
+        action=argparse.BooleanOptionalAction,
+        default=SKIP_DUPLICATES,
+        help="Reuse the stems of exactly repeated segments instead of separating them again",
+    )
+    return parser
+
+
+def execute_demucs(
+    command: list[str], log_container=None, encode_futures: list = None
+) -> List[Path]:
+    """
+    Executes Demucs audio separation with specified CLI-style arguments against
+    the resident model pool, redirecting stdout/stderr to a log container for
+    real-time monitoring. Output is left on the console when no container is given.
+
+    Returns:
+        List of written stem paths
+    """
+    args = get_separation_parser().parse_args(command[1:])  # Skip executable path/name
+    if log_container is None:
+        return separate_tracks(args, encode_futures)
 
     # Redirect stdout/stderr to log container (keep for non-progress logs)
     class Logger:
         def __init__(self, log_container):
             self.log_container = log_container
-            self.log_buffer = []
+            self.log_buffer = deque(maxlen=LOG_BUFFER_SIZE)
+            self.limiter = RateLimiter()
+            self.dirty = False
 
         def write(self, data):
-            for line in data.strip().split("\n"):
-                self.log_buffer.append(line)
-                self.log_container.text("\n".join(self.log_buffer[-LOG_BUFFER_SIZE:]))
+            lines = [line for line in data.strip().split("\n") if line]
+            if not lines:
+                return
+            self.log_buffer.extend(lines)
+            self.dirty = True
+            if self.limiter.ready():
+                self.flush()
 
         def flush(self):
-            pass
+            if self.dirty:
+                self.log_container.text("\n".join(self.log_buffer))
+                self.dirty = False
 
+    # Redirection is per thread so concurrent jobs keep their logs apart
+    _install_thread_routing()
     logger = Logger(log_container)
-    original_stdout, original_stderr = sys.stdout, sys.stderr
-    sys.stdout = logger
-    sys.stderr = logger
-
+    _log_target.logger = logger
     try:
-        sys.argv = ["demucs"] + args
-        demucs_main()
+        return separate_tracks(args, encode_futures)
     finally:
-        sys.stdout, sys.stderr = original_stdout, original_stderr
+        _log_target.logger = None
+        logger.flush()
 
 
-def process_audio(
-    model_name: str, output_dir: Path, stems: List[str], extension: str = "mp3"
-) -> List[Path]:
+def build_format_args(export_cfg: dict) -> List[str]:
+    """Translate an EXPORT_FORMAT config block into Demucs output flags"""
+    format_args = []
+    if export_cfg["format"]:
+        format_args.append(export_cfg["format"])
+        if export_cfg["format"] == "--mp3" and export_cfg["mp3_bitrate"]:
+            format_args += ["--mp3-bitrate", str(export_cfg["mp3_bitrate"])]
+    elif export_cfg["wav_bit_depth"]:
+        if export_cfg["wav_bit_depth"] in (32, "--float32"):
+            format_args.append("--float32")
+        elif export_cfg["wav_bit_depth"] in (24, "--int24"):
+            format_args.append("--int24")
+    return format_args
+
+
+def build_demucs_command(config: dict, input_path: Path, output_dir: Path) -> List[str]:
+    """Assemble the Demucs argument list for a separation config"""
+    return [
+        (
+            "demucs"
+            if not getattr(sys, "frozen", False)
+            else str(Path(sys._MEIPASS) / "demucs.exe")
+        ),
+        *config["STEM_MODE"],
+        "-n", config["MODEL_NAME"],
+        "-o", str(output_dir),
+        "--filename", f"{export_variant(config['EXPORT_FORMAT'])[0]}/{{stem}}.{{ext}}",
+        "--intermediate", "{stem}.npy",
+        "--manifest", MANIFEST_NAME,
+        "--shifts", str(config["SHIFTS"]),
+        "--overlap", str(config["OVERLAP"]),
+        "--backend", config.get("BACKEND", "float32"),
+        *(["--compile"] if config.get("COMPILE") else []),
+        *build_plan_args(config),
+        *build_format_args(config["EXPORT_FORMAT"]), "-d",
+        config["DEVICE"], str(input_path),
+    ]
+
+
+def build_plan_args(config: dict) -> List[str]:
+    """Segment and chunk parallelism flags chosen by the device planner"""
+    if not config.get("AUTO_TUNE"):
+        return []
+
+    # Plan for the device the separation will actually run on
+    plan = plan_separation(config["MODEL_NAME"], resolve_device(config["DEVICE"]))
+    plan_args = ["-j", str(plan["jobs"])]
+    if plan["segment"]:
+        plan_args += ["--segment", str(plan["segment"])]
+    return plan_args
+
+
+def run_separation(
+    input_path: Path,
+    config: dict,
+    key: str = None,
+    log_container=None,
+    cache: ResultCache = result_cache,
+    encode_futures: list = None,
+) -> Dict[str, Path]:
     """
-    Generates output paths for separated audio stems.
+    Separates one file into the cache entry for its content and separation
+    settings. A cached separation is only converted to the requested output
+    format (conversions are cached too), so changing formats never re-runs
+    the model.
 
     Args:
-        model_name: Name of the separation model
-        output_dir: Base directory for output files
-        stems: List of stem names produced by the model
-        extension: File format extension (default: 'mp3')
+        encode_futures: When given, the function returns as soon as the
+            model has run and a future for the remaining encoding (and the
+            cache update) is appended here
+
+    Returns:
+        Mapping of stem name to path, in display order
+    """
+    if key is None:
+        with open(input_path, "rb") as f:
+            key = cache_key(hash_stream(f), config)
+
+    cached_paths = cache.export(key, config["EXPORT_FORMAT"])
+    if cached_paths:
+        for export_cfg in config.get("EXTRA_FORMATS") or []:
+            cache.export(key, export_cfg)
+        return cached_paths
+
+    output_dir = cache.entry_dir(key)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    pending = []
+    manifest_path = separate_to_intermediates(
+        Path(input_path), config, output_dir, log_container, pending
+    )
+
+    def store():
+        record_exports(manifest_path, config)
+        cache.store(key, manifest_path, source_name=Path(input_path).name)
+
+    if encode_futures is None:
+        with record_phase("encode"):
+            wait_all(pending)
+        store()
+    else:
+        encode_futures.append(when_all(pending, store))
+    return export_paths(manifest_stems(manifest_path), config["EXPORT_FORMAT"])
+
+
+def separate_to_intermediates(
+    input_path: Path,
+    config: dict,
+    output_dir: Path,
+    log_container=None,
+    encode_futures: list = None,
+) -> Path:
+    """
+    Runs the model once, keeping float32 intermediates of every stem next to
+    the encodes of the configured format and any `EXTRA_FORMATS`, plus
+    waveform/spectrogram thumbnails of every stem and the mix.
+
+    Returns:
+        Path of the manifest describing the separated stems
+    """
+    execute_demucs(
+        build_demucs_command(config, input_path, output_dir), log_container, encode_futures
+    )
+    manifest_path = output_dir / config["MODEL_NAME"] / MANIFEST_NAME
+    manifest = read_manifest(manifest_path)
+    if manifest is None:
+        raise RuntimeError(f"Separation of {input_path.name} produced no stems")
+
+    with record_phase("thumbnails"):
+        intermediates = manifest_stems(manifest_path)
+        record_thumbnails(manifest_path, compute_thumbnails(intermediates, manifest_path.parent))
+
+    for export_cfg in config.get("EXTRA_FORMATS") or []:
+        export_stems(intermediates, manifest["samplerate"], export_cfg, encode_futures)
+    return manifest_path
+
+
+def record_exports(manifest_path: Path, config: dict) -> None:
+    """List the configured output format and `EXTRA_FORMATS` in the manifest"""
+    intermediates = manifest_stems(manifest_path)
+    for export_cfg in [config["EXPORT_FORMAT"], *(config.get("EXTRA_FORMATS") or [])]:
+        variant, ext, _ = export_variant(export_cfg)
+        record_export(manifest_path, variant, ext, export_paths(intermediates, export_cfg))
+
+
+def run_preview(
+    input_path: Path,
+    config: dict,
+    key: str,
+    start: float = 0.0,
+    duration: float = PREVIEW_SECONDS,
+    cache: ResultCache = result_cache,
+) -> Dict[str, Path]:
+    """
+    Separates only a region of a track into low-bitrate MP3 previews stored
+    inside the track's cache entry, so a model choice can be checked before
+    the full separation finishes.
 
     Returns:
-        List of paths where separated stems will be saved
+        Mapping of stem name to preview path, in display order
     """
-    model_dir = output_dir / model_name
-    return [model_dir / f"{stem}.{extension}" for stem in stems]
+    device = resolve_device(config["DEVICE"])
+    target = config["STEM_MODE"][-1] if config["STEM_MODE"] else None
+
+    def load_run_model(device: str):
+        # Same pool entry as the full separation of this job
+        model = model_pool.get(
+            config["MODEL_NAME"],
+            device,
+            backend=config.get("BACKEND", "float32"),
+            compile=config.get("COMPILE", False),
+        )
+        return restrict_to_stem(model, target) if target else model
+
+    # Keep the region inside the track, e.g. for a start past its end
+    track_seconds = track_duration(Path(input_path))
+    start = min(max(start, 0.0), max(track_seconds - duration, 0.0))
+    duration = max(min(duration, track_seconds - start), 1.0)
+
+    run_model = load_run_model(device)
+    preview_dir = cache.entry_dir(key) / f"preview_{int(start)}_{int(duration)}"
+    stems = [target, f"no_{target}"] if target else list(run_model.sources)
+    preview_paths = {stem: preview_dir / f"{stem}.mp3" for stem in stems}
+    if all(path.exists() for path in preview_paths.values()):
+        return preview_paths
+
+    samplerate = run_model.samplerate
+    wav = read_segment(
+        Path(input_path), int(start * samplerate), int(duration * samplerate),
+        samplerate, run_model.audio_channels,
+    )
+    ref = wav.mean(0)
+    mean, std = ref.mean(), ref.std() + 1e-8
+    with batch_session(run_model):
+        sources = apply_with_fallback(
+            run_model,
+            config["MODEL_NAME"],
+            ((wav - mean) / std)[None],
+            {"device": device, "shifts": config["SHIFTS"], "overlap": config["OVERLAP"]},
+            load_run_model,
+        )[0]
+    sources = dict(zip(run_model.sources, sources * std + mean))
+
+    preview_dir.mkdir(parents=True, exist_ok=True)
+    for stem, path in preview_paths.items():
+        if stem.startswith("no_"):
+            source = wav - sources[stem[len("no_"):]]
+        else:
+            source = sources[stem]
+        save_audio(source.cpu(), str(path), samplerate=samplerate, bitrate=PREVIEW_BITRATE)
+    return preview_paths
 
 
 def get_compute_device():
@@ -69,6 +844,15 @@ def get_compute_device():
     return "cpu"
 
 
+def resolve_device(device: str) -> str:
+    """Fall back to the CPU when CUDA was requested but torch cannot use it"""
+    if device.startswith("cuda") and not cuda_enabled():
+        print("CUDA is not usable by this torch build, falling back to CPU")
+        return "cpu"
+    return device
+
+
+@lru_cache(maxsize=None)
 def cuda_enabled() -> bool:
     if torch.cuda.is_available():
         return True
@@ -0,0 +1,82 @@
+# SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
+# SPDX-License-Identifier: Apache-2.0
+
+import warnings
+from pathlib import Path
+import torch
+from demucs.apply import BagOfModels
+from demucs.pretrained import get_model
+from config import CACHE_DIR, INFERENCE_BACKENDS
+from utils import log_error
+
+QUANTIZED_DIR = CACHE_DIR / "quantized"
+
+
+def quantized_path(name: str) -> Path:
+    """On-disk int8 copy of a model, tied to the torch version that packed it"""
+    version = torch.__version__.split("+")[0]
+    return QUANTIZED_DIR / f"{name}.int8.torch-{version}.pt"
+
+
+def quantize(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Dynamic int8 quantisation of the Linear and LSTM layers (including the
+    feed-forward and projection layers of transformer blocks). Weights are
+    stored as int8 and activations quantised on the fly, so no calibration
+    data is needed. Convolutions stay in float32.
+    """
+    from torch.ao.quantization import quantize_dynamic
+
+    with warnings.catch_warnings():
+        # Quantised tensor constructors warn about their deprecation on every call
+        warnings.simplefilter("ignore", UserWarning)
+        return quantize_dynamic(model, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8)
+
+
+def load_quantized(name: str, repo: Path = None) -> torch.nn.Module:
+    """Load the int8 variant of a model, quantising and caching it on first use"""
+    path = quantized_path(name)
+    if repo is None and path.exists():
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)
+                return torch.load(path, map_location="cpu", weights_only=False)
+        except Exception as e:
+            log_error(e)
+
+    model = quantize(get_model(name=name, repo=repo).eval())
+    if repo is None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        torch.save(model, tmp_path)
+        tmp_path.replace(path)
+    return model
+
+
+def compile_model(model) -> None:
+    """
+    Compile the forward pass of a model (or of every model in a bag) in
+    place. Parts the compiler cannot handle fall back to eager execution.
+    """
+    import torch._dynamo
+
+    torch._dynamo.config.suppress_errors = True
+    for leaf in model.models if isinstance(model, BagOfModels) else [model]:
+        leaf.forward = torch.compile(leaf.forward, dynamic=False)
+
+
+def load_model(name: str, device: str, repo: Path = None, backend: str = "float32"):
+    """
+    Load a model for an inference backend.
+
+    Args:
+        name: Pretrained model name
+        device: Target device; the int8 backend only runs on the CPU
+        repo: Local model repository, if any
+        backend: One of INFERENCE_BACKENDS
+    """
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"backend must be one of {INFERENCE_BACKENDS}")
+    if backend == "int8":
+        return load_quantized(name, repo)
+    return get_model(name=name, repo=repo)
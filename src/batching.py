@@ -0,0 +1,127 @@
+# SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
+# SPDX-License-Identifier: Apache-2.0
+
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, List
+import torch
+from demucs.apply import BagOfModels
+from config import BATCH_MAX_SEGMENTS, BATCH_MAX_WAIT_MS
+
+_sessions_lock = threading.Lock()
+# New threads inherit the intra-op count of the moment they start, which a
+# parallel chunk may have lowered, so the dispatcher restores the full count
+_DISPATCH_THREADS = torch.get_num_threads()
+
+
+class SegmentBatcher:
+    """
+    Replaces the forward pass of a resident model so segments submitted by
+    concurrent jobs are stacked into one batched forward pass. A dispatcher
+    thread waits up to `max_wait` seconds for up to `max_batch` segments,
+    groups them by shape and hands every caller its slice of the output,
+    which `apply_model` then overlap-adds into that job's buffers as usual.
+    While fewer than two jobs use the model, calls run directly.
+    """
+
+    def __init__(
+        self,
+        forward: Callable[[torch.Tensor], torch.Tensor],
+        max_batch: int = BATCH_MAX_SEGMENTS,
+        max_wait: float = BATCH_MAX_WAIT_MS / 1000,
+    ):
+        self.forward = forward
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.sessions = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        if self.sessions < 2 or self.max_batch < 2:
+            return self.forward(x)
+
+        future = Future()
+        self._queue.put((x, future))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._dispatch, name="segment-batcher", daemon=True
+                )
+                self._thread.start()
+        return future.result()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+            size += len(batch[-1][0])
+        return batch
+
+    def _dispatch(self) -> None:
+        torch.set_num_threads(_DISPATCH_THREADS)
+        while True:
+            groups = defaultdict(list)
+            for x, future in self._collect():
+                groups[(tuple(x.shape[1:]), x.dtype, x.device)].append((x, future))
+            for items in groups.values():
+                self._run(items)
+
+    def _run(self, items: list) -> None:
+        try:
+            with torch.no_grad():
+                out = self.forward(torch.cat([x for x, _ in items]))
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for x, future in items:
+            future.set_result(out[offset : offset + len(x)])
+            offset += len(x)
+
+
+def _leaves(model) -> List[torch.nn.Module]:
+    return list(model.models) if isinstance(model, BagOfModels) else [model]
+
+
+def _batchers(model) -> List[SegmentBatcher]:
+    return [
+        leaf.forward for leaf in _leaves(model) if isinstance(leaf.forward, SegmentBatcher)
+    ]
+
+
+def enable_batching(model) -> None:
+    """Route the forward passes of a model (or every model in a bag) through batchers"""
+    for leaf in _leaves(model):
+        if not isinstance(leaf.forward, SegmentBatcher):
+            leaf.forward = SegmentBatcher(leaf.forward)
+
+
+@contextmanager
+def batch_session(model):
+    """Mark a job as running `model`, so its segments may be batched with other jobs"""
+    batchers = _batchers(model)
+    with _sessions_lock:
+        for batcher in batchers:
+            batcher.sessions += 1
+    try:
+        yield
+    finally:
+        with _sessions_lock:
+            for batcher in batchers:
+                batcher.sessions -= 1
@@ -1,6 +1,7 @@
 # SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
 # SPDX-License-Identifier: Apache-2.0
 
+import os
 from pathlib import Path
 
 CACHE_DIR = Path(".cache")
@@ -8,7 +9,78 @@ OUTPUT_DIR = Path("output")
 MODEL_NAME = ["htdemucs", "htdemucs_ft", "htdemucs_6s", "hdemucs_mmi", "mdx"]
 ALLOWED_EXTENSIONS = ("mp3", "wav")
 MAX_FILE_SIZE_MB = 200
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+DECODE_CHUNK_FRAMES = 1 << 18
+# Tracks longer than this are separated segment by segment with bounded memory
+STREAMING_MIN_SECONDS = 900
+STREAM_SEGMENT_SECONDS = 60
+STREAM_OVERLAP_SECONDS = 2
+# Silent stretches (peak at or below the threshold) skipped during separation
+SKIP_SILENCE = True
+SILENCE_THRESHOLD_DB = -60
+SILENCE_MIN_SECONDS = 2.0
+SILENCE_PAD_SECONDS = 0.5
+SILENCE_BLOCK_SECONDS = 0.01
+# Exactly repeated windows of this length reuse the first occurrence's stems
+SKIP_DUPLICATES = False
+DUPLICATE_SEGMENT_SECONDS = 4
+PREVIEW_SECONDS = 30
+PREVIEW_BITRATE = 128
+# Low-bitrate encodes for the in-page players; full stems are only downloaded
+PLAYER_BITRATE = 96
+STEM_URL_PREFIX = "/stems/"
+STEM_CACHE_SECONDS = 86400
+# Waveform/spectrogram thumbnails stored per stem
+THUMB_BINS = 600
+THUMB_SPEC_FRAMES = 300
+THUMB_SPEC_BANDS = 64
+THUMB_FFT_SIZE = 2048
+THUMB_DB_RANGE = 80
 LOG_BUFFER_SIZE = 50
+# Minimum seconds between progress/log pushes to the browser
+UI_FLUSH_INTERVAL = 0.25
+MODEL_POOL_MEMORY_MB = 2048
+RESULT_CACHE_MAX_MB = 5120
+DEFAULT_SHIFTS = 1
+DEFAULT_OVERLAP = 0.25
+JOB_QUEUE_PATH = OUTPUT_DIR / "jobs.json"
+JOB_MAX_ATTEMPTS = 2
+# Upper bound on concurrent jobs; the scheduler derives the actual limit
+# from the core count and the RAM available at startup
+JOB_WORKERS = 4
+JOB_POLL_INTERVAL = 1.0
+# Submissions beyond these queue lengths are rejected until jobs drain
+JOB_MAX_PENDING = 64
+JOB_MAX_PENDING_PER_SESSION = 32
+# Decoded mix, normalised copy and up to six stems held in RAM (float32 stereo)
+JOB_AUDIO_MB_PER_SECOND = 5
+METRICS_LOG_PATH = OUTPUT_DIR / "job_metrics.jsonl"
+METRICS_LOG_MAX_MB = 50
+# Approximate resident size of each model's weights (float32)
+MODEL_MEMORY_MB = {
+    "htdemucs": 170,
+    "htdemucs_ft": 680,
+    "htdemucs_6s": 110,
+    "hdemucs_mmi": 340,
+    "mdx": 1400,
+}
+WORKER_OVERHEAD_MB = 1536
+MIN_THREADS_PER_WORKER = 2
+# Device planner: rough activation memory per second of segment per chunk
+ACTIVATION_MB_PER_SECOND = 64
+DEFAULT_SEGMENT_SECONDS = 8
+MIN_SEGMENT_SECONDS = 1
+PLANNER_RESERVE_MB = 1024
+THREADS_PER_CHUNK_JOB = 4
+# CPU inference backends: stock float32 or dynamically quantised int8 weights
+INFERENCE_BACKENDS = ("float32", "int8")
+# Segments of concurrent jobs sharing a model are batched into one forward pass
+BATCH_MAX_SEGMENTS = 4
+BATCH_MAX_WAIT_MS = 20
+# Stem encoder processes running alongside separation (0 encodes inline)
+ENCODER_WORKERS = min(4, max(1, (os.cpu_count() or 1) // 2))
+# Intermediates are encoded in blocks of this length to bound worker memory
+ENCODE_BLOCK_SECONDS = 30
 ICON_PATH = str(Path(__file__).parent.absolute() / "static" / "icon.svg")
 FAVICON_PATH = str(Path(__file__).parent.absolute() / "static" / "favicon.svg")
 LOGO_PATH = str(Path(__file__).parent.absolute() / "static" / "logo.svg")
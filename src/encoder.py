@@ -0,0 +1,255 @@
+# SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
+# SPDX-License-Identifier: Apache-2.0
+
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple, Union
+import numpy as np
+from config import ENCODE_BLOCK_SECONDS, ENCODER_WORKERS
+
+
+def _encode(wav: Union[np.ndarray, str], path: str, save_kwargs: dict) -> str:
+    import torch
+    from demucs.audio import save_audio
+
+    path = Path(path)
+    # Encode next to the target so an interrupted export never looks finished
+    tmp_path = path.with_name(f"{path.stem}.part{path.suffix}")
+    if isinstance(wav, str):
+        _encode_blocks(wav, tmp_path, save_kwargs)
+    else:
+        save_audio(torch.from_numpy(wav), str(tmp_path), **save_kwargs)
+    tmp_path.replace(path)
+    return str(path)
+
+
+def _encode_blocks(source: str, path: Path, save_kwargs: dict) -> None:
+    """
+    Encode a float32 intermediate, stored as (frames, channels), block by
+    block from its memory map so memory stays flat however long the track.
+    Clipping follows `save_audio`, with the whole-track rescale gain found
+    in a first pass.
+    """
+    import torch
+    from demucs.audio import prevent_clip
+    from streaming import StemWriter
+
+    frames = np.load(source, mmap_mode="r")
+    samplerate = save_kwargs["samplerate"]
+    block = int(ENCODE_BLOCK_SECONDS * samplerate)
+    clip = save_kwargs.get("clip", "rescale")
+    scale = 1.0
+    if clip == "rescale":
+        peak = max(
+            (float(np.abs(frames[i : i + block]).max()) for i in range(0, len(frames), block)),
+            default=0.0,
+        )
+        scale = 1 / max(1.01 * peak, 1)
+        clip = "none"
+
+    writer = StemWriter(
+        path,
+        samplerate,
+        frames.shape[1],
+        **{
+            key: save_kwargs[key]
+            for key in ("bitrate", "preset", "bits_per_sample", "as_float")
+            if key in save_kwargs
+        },
+    )
+    try:
+        for start in range(0, len(frames), block):
+            wav = torch.from_numpy(np.ascontiguousarray(frames[start : start + block].T))
+            writer.write(prevent_clip(wav * scale, mode=clip))
+    finally:
+        writer.close()
+
+
+@contextmanager
+def _light_main():
+    """
+    Let spawned workers import this module as their __main__ instead of the
+    launching script, which under Streamlit is the app with its whole UI
+    stack. Spawn-context pools start workers on demand inside submit().
+    """
+    main = sys.modules.get("__main__")
+    sys.modules["__main__"] = sys.modules[__name__]
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+class EncoderPool:
+    """
+    Encodes separated stems in worker processes so MP3/FLAC encoding of one
+    track overlaps the separation of the next. With zero workers stems are
+    encoded inline on the calling thread.
+    """
+
+    def __init__(self, workers: int = ENCODER_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None and self.workers > 0:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def submit(self, wav, path: Path, save_kwargs: dict) -> Future:
+        """Schedule one stem for encoding; resolves to the written path
+
+        Args:
+            wav: Stem as a (channels, frames) tensor or array, or the path of
+                a float32 intermediate to encode from
+        """
+        if isinstance(wav, Path):
+            wav = str(wav)
+        elif hasattr(wav, "detach"):
+            wav = wav.detach().cpu().numpy()
+        executor = self._get_executor()
+        if executor is not None:
+            with self._lock, _light_main():
+                return executor.submit(_encode, wav, str(path), save_kwargs)
+
+        future = Future()
+        try:
+            future.set_result(_encode(wav, str(path), save_kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def set_workers(self, workers: int) -> None:
+        """Resize the pool; takes effect for the next submission"""
+        self.shutdown()
+        self.workers = workers
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+def export_variant(export_cfg: dict) -> Tuple[str, str, dict]:
+    """
+    Resolve an EXPORT_FORMAT config block into the folder name that holds
+    its encodes, the file extension and the encoder options.
+
+    Returns:
+        Tuple of (variant, extension, save_kwargs)
+    """
+    if export_cfg.get("format") == "--mp3":
+        bitrate = int(export_cfg.get("mp3_bitrate") or 320)
+        return f"mp3_{bitrate}", "mp3", {"bitrate": bitrate}
+    if export_cfg.get("format") == "--flac":
+        return "flac", "flac", {}
+    if export_cfg.get("wav_bit_depth") in (32, "--float32"):
+        return "wav_f32", "wav", {"as_float": True}
+    if export_cfg.get("wav_bit_depth") in (24, "--int24"):
+        return "wav_24", "wav", {"bits_per_sample": 24}
+    return "wav_16", "wav", {}
+
+
+def export_paths(intermediates: Dict[str, Path], export_cfg: dict) -> Dict[str, Path]:
+    """Encoded stem paths for a format, next to their intermediates"""
+    variant, ext, _ = export_variant(export_cfg)
+    return {
+        name: path.parent / variant / f"{path.stem}.{ext}"
+        for name, path in intermediates.items()
+    }
+
+
+def export_stems(
+    intermediates: Dict[str, Path],
+    samplerate: int,
+    export_cfg: dict,
+    futures: list = None,
+    pool: EncoderPool = None,
+) -> Dict[str, Path]:
+    """
+    Encode float32 intermediates into the format of `export_cfg`. Earlier
+    conversions are reused, so switching formats never re-runs the model.
+
+    Args:
+        intermediates: Stem name to .npy file written during separation
+        samplerate: Sample rate of the intermediates
+        export_cfg: EXPORT_FORMAT config block
+        futures: When given, pending encodes are appended here instead of
+            being awaited
+        pool: Encoder pool to run conversions on (default: shared pool)
+
+    Returns:
+        Mapping of stem name to encoded path, in the order of `intermediates`
+    """
+    pool = pool or encoder_pool
+    _, _, save_kwargs = export_variant(export_cfg)
+    paths = export_paths(intermediates, export_cfg)
+
+    pending = []
+    for name, path in paths.items():
+        if path.exists():
+            continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pending.append(
+            pool.submit(intermediates[name], path, {"samplerate": samplerate, **save_kwargs})
+        )
+
+    if futures is not None:
+        futures.extend(pending)
+    else:
+        wait_all(pending)
+    return paths
+
+
+def when_all(futures: List[Future], callback: Callable[[], None] = None) -> Future:
+    """
+    Future that resolves once every future in `futures` has finished and
+    `callback` has run. Fails with the first error of the group.
+    """
+    combined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def finish():
+        errors = [future.exception() for future in futures if future.exception()]
+        if errors:
+            combined.set_exception(errors[0])
+            return
+        try:
+            if callback is not None:
+                callback()
+            combined.set_result(None)
+        except Exception as e:
+            combined.set_exception(e)
+
+    def on_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        finish()
+
+    if not futures:
+        finish()
+    for future in futures:
+        future.add_done_callback(on_done)
+    return combined
+
+
+def wait_all(futures: List[Future]) -> None:
+    """Block until every encode finished, re-raising the first failure"""
+    for future in futures:
+        future.result()
+
+
+encoder_pool = EncoderPool()
@@ -6,8 +6,9 @@ import threading
 import http.server
 import socketserver
 import time
-from typing import List
+from typing import Dict, Optional, Tuple
 from pathlib import Path
+from urllib.parse import quote, unquote, urlsplit
 import streamlit as st
 from streamlit.components.v1 import html
 from config import (
@@ -18,8 +19,25 @@ from config import (
     ALLOWED_EXTENSIONS,
     ABOUT_TEXT,
     MODEL_NAME,
+    DEFAULT_SHIFTS,
+    INFERENCE_BACKENDS,
+    DEFAULT_OVERLAP,
+    PREVIEW_SECONDS,
+    PLAYER_BITRATE,
+    OUTPUT_DIR,
+    STEM_URL_PREFIX,
+    STEM_CACHE_SECONDS,
+    UPLOAD_CHUNK_SIZE,
 )
-from utils import load_css, load_js, replace_tqdm, log_error
+from encoder import export_variant
+from metrics import metrics
+from manifest import MANIFEST_NAME, manifest_stems, manifest_thumbnails
+from thumbnails import envelope_svg, load_thumbnail, spectrogram_image
+from utils import load_css, load_js, log_error, cuda_driver_available, startup_metrics
+
+# Small encodes played in the page; exported alongside every separation
+PLAYER_EXPORT = {"format": "--mp3", "mp3_bitrate": PLAYER_BITRATE, "wav_bit_depth": None}
+STEM_MIME_TYPES = {".mp3": "audio/mpeg", ".wav": "audio/wav", ".flac": "audio/flac"}
 
 
 def inject_custom_scripts(height: int = 0, **kwargs):
@@ -36,10 +54,50 @@ def inject_custom_styles():
         st.markdown(css, unsafe_allow_html=True)
 
 
+def parse_byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse the first range of an HTTP Range header.
+
+    Returns:
+        Inclusive (start, end) byte offsets, or None when unsatisfiable
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip() != "bytes" or not ranges:
+        return None
+    first, _, last = ranges.split(",")[0].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range: the final N bytes
+            start, end = max(size - int(last), 0), size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
 class ShutdownHandler(http.server.BaseHTTPRequestHandler):
+    """Side server: shutdown requests plus stem files served from disk with
+    HTTP Range support, so players never load whole stems into memory"""
+
     def do_GET(self):
+        if self.path.startswith(STEM_URL_PREFIX):
+            self.send_stem()
+            return
+        if self.path == "/metrics":
+            self.send_metrics()
+            return
         self.handle_shutdown_request()
 
+    def do_HEAD(self):
+        if self.path.startswith(STEM_URL_PREFIX):
+            self.send_stem(head_only=True)
+            return
+        self.send_error(404)
+
     def do_POST(self):
         self.handle_shutdown_request()
 
@@ -53,26 +111,110 @@ class ShutdownHandler(http.server.BaseHTTPRequestHandler):
             self.wfile.write(b"Terminating server...")
             os.kill(os.getpid(), 9)
 
+    def send_metrics(self):
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stem(self, head_only: bool = False):
+        url = urlsplit(self.path)
+        root = OUTPUT_DIR.resolve()
+        path = (root / unquote(url.path[len(STEM_URL_PREFIX):])).resolve()
+        if (
+            root not in path.parents
+            or path.suffix.lower() not in STEM_MIME_TYPES
+            or not path.is_file()
+        ):
+            self.send_error(404)
+            return
+
+        size = path.stat().st_size
+        start, end = 0, size - 1
+        range_header = self.headers.get("Range")
+        if range_header:
+            byte_range = parse_byte_range(range_header, size)
+            if byte_range is None:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+
+        self.send_header("Content-Type", STEM_MIME_TYPES[path.suffix.lower()])
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        # Stems live under content-addressed folders and never change in place
+        self.send_header("Cache-Control", f"private, max-age={STEM_CACHE_SECONDS}")
+        if "download" in url.query:
+            self.send_header("Content-Disposition", f'attachment; filename="{path.name}"')
+        self.end_headers()
+        if head_only:
+            return
+
+        try:
+            with open(path, "rb") as f:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = f.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # Players routinely abort a range request when seeking
+            pass
+
     def do_OPTIONS(self):
         self.send_response(204)
         self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        self.send_header("Access-Control-Allow-Methods", "GET, HEAD, POST, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type, Range")
         self.send_header("Access-Control-Max-Age", "86400")
         self.end_headers()
 
+    def log_message(self, format, *args):
+        # Seeking issues many range requests; keep the console quiet
+        pass
 
-def run_shutdown_server():
+
+class SideServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def side_server_port() -> int:
     from streamlit import config
 
-    port = config.get_option("server.port")
     # Different port for shutdown server
-    shutdown_port = port + 1
-    with socketserver.TCPServer(("", shutdown_port), ShutdownHandler) as httpd:
-        httpd.allow_reuse_address = True
+    return config.get_option("server.port") + 1
+
+
+def run_shutdown_server():
+    with SideServer(("", side_server_port()), ShutdownHandler) as httpd:
         httpd.serve_forever()
 
 
+def stem_url(path: Path, download: bool = False) -> Optional[str]:
+    """URL of a stem on the side server, or None when it is outside the output folder"""
+    try:
+        relative = Path(path).resolve().relative_to(OUTPUT_DIR.resolve())
+    except ValueError:
+        return None
+    host = st.context.headers.get("Host", "localhost").rsplit(":", 1)[0]
+    url = f"http://{host}:{side_server_port()}{STEM_URL_PREFIX}{quote(relative.as_posix())}"
+    return f"{url}?download=1" if download else url
+
+
 def render_shutdown_button():
     """Render and handle shutdown functionality"""
     if st.button("Shut Down", key="shutdown_button"):
@@ -125,8 +267,6 @@ def config_page():
 
         render_shutdown_button()
 
-        replace_tqdm()
-
         # Only start the shutdown server once per session
         if "shutdown_server_started" not in st.session_state:
             shutdown_thread = threading.Thread(target=run_shutdown_server, daemon=True)
@@ -153,7 +293,7 @@ def render_header_section():
 def render_advanced_config() -> dict:
     """Renders an expandable advanced configuration panel and returns user-selected values"""
     try:
-        from audio_processor import cuda_enabled
+        cuda_available = cuda_driver_available()
 
         with st.expander("Advanced optional configurations", expanded=False):
             st.markdown("#### Core Separation Parameters")
@@ -192,6 +332,26 @@ def render_advanced_config() -> dict:
             else:
                 stem_config = []
 
+            col1, col2 = st.columns(2)
+            with col1:
+                shifts = st.number_input(
+                    "Shifts",
+                    min_value=1,
+                    max_value=10,
+                    value=DEFAULT_SHIFTS,
+                    help="Number of random shifts averaged per prediction. "
+                    "Improves quality slightly at a proportional cost in time.",
+                )
+            with col2:
+                overlap = st.slider(
+                    "Overlap",
+                    min_value=0.0,
+                    max_value=0.9,
+                    value=DEFAULT_OVERLAP,
+                    step=0.05,
+                    help="Overlap between consecutive segments",
+                )
+
             st.markdown("#### Output Format Configuration")
             col1, col2 = st.columns(2)
             with col1:
@@ -219,12 +379,40 @@ def render_advanced_config() -> dict:
 
             gpu_accelerator = st.checkbox(
                 "GPU accelerator",
-                value=True if cuda_enabled() else False,
-                disabled=not cuda_enabled(),
+                value=cuda_available,
+                disabled=not cuda_available,
                 help="Enable GPU acceleration (only available if CUDA is detected)",
             )
             device = "cuda" if gpu_accelerator else "cpu"
+            col1, col2 = st.columns(2)
+            with col1:
+                backend = st.selectbox(
+                    "CPU Backend",
+                    options=INFERENCE_BACKENDS,
+                    index=0,
+                    disabled=gpu_accelerator,
+                    help="int8 runs dynamically quantised weights: faster on the CPU "
+                    "at a small accuracy cost (see benchmarks/bench_separation.py --backends)",
+                )
+            with col2:
+                compile_model = st.checkbox(
+                    "Compile model",
+                    value=False,
+                    help="Compile the model graph on first load. Slower to start, "
+                    "faster for long or repeated separations",
+                )
+            auto_tune = st.checkbox(
+                "Auto-tune for this machine",
+                value=True,
+                help="Pick segment size and parallel chunks from available memory and "
+                "cores, stepping down automatically on out-of-memory errors",
+            )
             st.info(f"Using device: {device}")
+            if startup_metrics:
+                st.caption(
+                    "Startup: "
+                    + " | ".join(f"{name} {seconds:.2f}s" for name, seconds in startup_metrics.items())
+                )
 
             return {
                 "MODEL_NAME": model,
@@ -242,73 +430,186 @@ def render_advanced_config() -> dict:
                         else "--int24" if wav_bit_depth == "24-bit int" else None
                     ),
                 },
+                "SHIFTS": int(shifts),
+                "OVERLAP": float(overlap),
                 "DEVICE": device,
+                "AUTO_TUNE": auto_tune,
+                "BACKEND": "float32" if gpu_accelerator else backend,
+                "COMPILE": compile_model,
+                "EXTRA_FORMATS": [PLAYER_EXPORT],
             }
 
     except Exception as e:
         log_error(e)
 
 
-def render_file_uploader():
-    """Render file uploader"""
+def render_file_uploader(batch: bool = False):
+    """Render file uploader, accepting several files in batch mode"""
     return st.file_uploader(
-        "Choose Audio File", type=ALLOWED_EXTENSIONS, accept_multiple_files=False
+        "Choose Audio Files" if batch else "Choose Audio File",
+        type=ALLOWED_EXTENSIONS,
+        accept_multiple_files=batch,
     )
 
 
-def render_output(stem_paths: List[Path], channels: int = 2) -> None:
+def render_preview_options(track_seconds: float = None):
+    """Render quick preview options; returns (start, duration) in seconds or None
+
+    Args:
+        track_seconds: Length of the uploaded track, if known; bounds the region
+    """
+    if track_seconds is not None and track_seconds <= PREVIEW_SECONDS:
+        # The full separation is about as quick as a preview
+        return None
+    if not st.checkbox(
+        "Quick preview first",
+        value=True,
+        help="Separate a short region first so the model choice can be checked "
+        "while the full track is still processing",
+    ):
+        return None
+
+    start, end = st.slider(
+        "Preview region (seconds)",
+        min_value=0,
+        max_value=int(track_seconds) if track_seconds else 600,
+        value=(0, PREVIEW_SECONDS),
+        step=5,
+    )
+    return (start, max(end - start, 5))
+
+
+def render_batch_mode_toggle() -> bool:
+    """Render the batch mode switch"""
+    return st.checkbox(
+        "Batch mode",
+        value=False,
+        help="Queue several files or a whole folder for separation",
+    )
+
+
+def render_folder_input() -> str:
+    """Render a text input for a local folder to queue in batch mode"""
+    return st.text_input(
+        "Or separate every audio file in a folder",
+        placeholder="/path/to/album",
+    ).strip()
+
+
+def queue_position(job: dict) -> str:
+    """Describe where a pending job stands in the queue"""
+    if not job.get("position"):
+        return ""
+    if job["position"] == 1:
+        return "Next in line"
+    return f"Position {job['position']} of {job['queued']} in the queue"
+
+
+def render_job_status(job: dict) -> bool:
+    """Render one queued job; returns True when its retry button was clicked
+
+    Args:
+        job: Job record from the job queue
+    """
+    status_icons = {"pending": "⏳", "running": "⚙️", "done": "✅", "failed": "❌"}
+    st.markdown(f"**{status_icons.get(job['status'], '')} {job['name']}** — {job['status']}")
+
+    if job["status"] == "pending":
+        st.caption(queue_position(job))
+    elif job["status"] == "running":
+        st.progress(job["progress"])
+    elif job["status"] == "failed":
+        st.caption(f"Failed after {job['attempts']} attempt(s): {job['error']}")
+        return st.button("Retry", key=f"retry_{job['id']}")
+    elif job["status"] == "done" and job["stems"]:
+        with st.expander("Stems", expanded=False):
+            render_output(job["stems"])
+    return False
+
+
+STEM_LABELS = {
+    "vocals": ("🎤", "vocals"),
+    "no_vocals": ("🎵", "accompaniment"),
+    "drums": ("🥁", "drums"),
+    "bass": ("🎚️", "bass"),
+    "guitar": ("🎸", "guitar"),
+    "piano": ("🎹", "piano"),
+    "other": ("🎶", "other"),
+}
+
+
+def render_output(stems: Dict[str, Path]) -> None:
     """Render audio output section with dynamic stem visualization
 
     Args:
-        stem_paths: List of paths to separated audio stems
-        channels: Number of audio channels (2, 4, or 6)
+        stems: Mapping of stem name to separated audio file, as listed in
+            the separation manifest
     """
-    VALID_CHANNELS = (2, 4, 6)
-    if channels not in VALID_CHANNELS:
-        raise ValueError(f"Channels must be one of {VALID_CHANNELS}")
-
-    stem_config = {
-        2: [("🎤", "vocals"), ("🎵", "accompaniment")],
-        4: [("🎤", "vocals"), ("🥁", "drums"), ("🎸", "bass"), ("🎹", "other")],
-        6: [
-            ("🎤", "vocals"),
-            ("🥁", "drums"),
-            ("🎚️", "bass"),
-            ("🎸", "guitar"),
-            ("🎹", "piano"),
-            ("🎵", "other"),
-        ],
-    }
-
-    # Validate stem count matches channel configuration
-    expected_stems = channels
-    if len(stem_paths) != expected_stems:
-        st.error(f"Expected {expected_stems} stems, found {len(stem_paths)}")
+    if not stems:
+        st.error("No stems were produced")
         return
 
+    # Players and thumbnails come from the manifest when one is available
+    manifest_path = Path(next(iter(stems.values()))).parent.parent / MANIFEST_NAME
+    players = manifest_stems(manifest_path, export_variant(PLAYER_EXPORT)[0]) or {}
+    thumbnails = manifest_thumbnails(manifest_path)
+    if "mix" in thumbnails:
+        st.markdown("#### 🎧 Mix")
+        render_thumbnail(thumbnails["mix"])
+
     # Render stems with error handling
     cols = st.columns(2)
 
-    for idx, (path, (emoji, label)) in enumerate(
-        zip(stem_paths, stem_config[channels])
-    ):
+    # Known stems in a fixed order (vocals first), any others after them
+    order = list(STEM_LABELS)
+    ranked = sorted(
+        stems.items(),
+        key=lambda item: order.index(item[0]) if item[0] in order else len(order),
+    )
+    for idx, (name, path) in enumerate(ranked):
+        emoji, label = STEM_LABELS.get(name, ("🎵", name.replace("_", " ")))
+        path = Path(path)
         with cols[idx % 2]:
             if path and path.exists():
-                file_format = f"audio/{path.suffix.lstrip('.')}"
                 st.markdown(f"#### {emoji} {label.title()}")
-                st.audio(str(path), format=file_format)
+                if name in thumbnails:
+                    render_thumbnail(thumbnails[name])
+                player = Path(players.get(name, path))
+                url = stem_url(player)
+                if url:
+                    # Streamed from disk by the side server instead of held in memory
+                    st.audio(url, format=STEM_MIME_TYPES[player.suffix.lower()])
+                    st.markdown(
+                        f"[Download {path.suffix.lstrip('.').upper()}]"
+                        f"({stem_url(path, download=True)})"
+                    )
+                else:
+                    st.audio(str(path), format=f"audio/{path.suffix.lstrip('.')}")
             else:
                 st.error(f"{label.title()} extraction failed")
 
 
-def render_processing_expander():
-    """Render processing details expander"""
-    with st.expander("Processing Details", expanded=False, icon="📜"):
-        output_container = st.empty()
+def render_thumbnail(path: Path) -> None:
+    """Render a precomputed waveform envelope and spectrogram thumbnail"""
+    if not path.exists():
+        return
+    thumbnail = load_thumbnail(path)
+    st.markdown(envelope_svg(thumbnail["peaks"], thumbnail["rms"]), unsafe_allow_html=True)
+    with st.expander("Spectrogram", expanded=False):
+        st.image(spectrogram_image(thumbnail["spectrogram"]), width="stretch")
+
 
-        if "progress_bar" not in st.session_state:
-            st.session_state.progress_bar = st.empty()
-        if "progress_text" not in st.session_state:
-            st.session_state.progress_text = st.empty()
+def render_job_progress(job: dict) -> None:
+    """Render status, progress and log tail of a running background job
 
-        return output_container
+    Args:
+        job: Job record from the job queue
+    """
+    if job["status"] == "pending":
+        st.info(f"Queued for processing... {queue_position(job)}")
+    else:
+        st.info(f"Processing {job['name']}... (attempt {job['attempts']})")
+    st.progress(job["progress"])
+
+    with st.expander("Processing Details", expanded=False, icon="📜"):
+        st.text(job["log"])
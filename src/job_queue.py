@@ -0,0 +1,503 @@
+# SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
+# SPDX-License-Identifier: Apache-2.0
+
+import copy
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+import soundfile
+from config import (
+    JOB_QUEUE_PATH,
+    JOB_MAX_ATTEMPTS,
+    JOB_MAX_PENDING,
+    JOB_MAX_PENDING_PER_SESSION,
+)
+from encoder import when_all
+from manifest import MANIFEST_NAME, read_manifest
+from metrics import PeakRSS, metrics
+from planner import job_memory_mb, model_memory_mb, plan_job_slots
+from progress import set_progress_hook, set_phase_timings
+from result_cache import hash_stream, cache_key
+from utils import log_error, record_startup_metric, replace_tqdm
+
+# Previews jump ahead of full separations waiting in the queue
+PREVIEW_PRIORITY = 0
+DEFAULT_PRIORITY = 1
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a submission would exceed the pending-job limits"""
+
+
+def _probe_seconds(input_path: Path) -> Optional[float]:
+    """Track duration from the file header, or None if it cannot be read"""
+    try:
+        return soundfile.info(str(input_path)).duration
+    except RuntimeError:
+        return None
+
+
+class JobLog:
+    """Log container stand-in that keeps the latest log text on the job record"""
+
+    def __init__(self, job: dict):
+        self.job = job
+
+    def text(self, body: str) -> None:
+        self.job["log"] = body
+
+
+class JobQueue:
+    """
+    Persistent queue of separation jobs processed by background worker threads.
+    Job records survive restarts; interrupted jobs are re-queued on load and
+    failed jobs are retried up to `max_attempts` times.
+
+    Jobs are admitted within a process-wide budget: at most `workers` run at
+    once, and the estimated memory of the admitted jobs (their audio buffers
+    plus the weights of each model in use) must fit in `memory_mb`; a job
+    too large for the budget only runs alone. Previews go first, then
+    sessions take turns, so one session's batch cannot hold back others.
+    """
+
+    def __init__(
+        self,
+        state_path: Path = JOB_QUEUE_PATH,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        workers: int = None,
+        memory_mb: int = None,
+        max_pending: int = JOB_MAX_PENDING,
+        max_pending_per_session: int = JOB_MAX_PENDING_PER_SESSION,
+    ):
+        budget = plan_job_slots()
+        self.state_path = state_path
+        self.max_attempts = max_attempts
+        self.workers = workers or budget["slots"]
+        self.memory_mb = budget["memory_mb"] if memory_mb is None else memory_mb
+        self.max_pending = max_pending
+        self.max_pending_per_session = max_pending_per_session
+        self._jobs = {}
+        # Pending job ids in arrival order; admitted job id -> (model, memory)
+        self._pending = []
+        self._admitted = {}
+        # Round of the latest admission, overall and per session
+        self._round = 0
+        self._session_rounds = {}
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._threads = []
+        self._load()
+        metrics.add_gauge("sol_jobs_pending", "Jobs waiting in the queue", lambda: len(self._pending))
+        metrics.add_gauge(
+            "sol_jobs_running",
+            "Jobs being processed",
+            lambda: sum(job["status"] == RUNNING for job in self.jobs()),
+        )
+        metrics.add_gauge(
+            "sol_jobs_admitted_memory_mb",
+            "Estimated memory of the jobs being separated",
+            self._admitted_memory_mb,
+        )
+
+    def submit(
+        self,
+        input_path: Path,
+        config: dict,
+        batch: str = None,
+        key: str = None,
+        preview: tuple = None,
+        session: str = None,
+    ) -> str:
+        """Queue a file for separation and return its job id
+
+        Args:
+            preview: Optional (start, duration) in seconds to separate only
+                that region as a quick preview
+            session: Id of the submitting browser session, used to share
+                the workers fairly between sessions
+
+        Raises:
+            QueueFullError: Too many jobs are already waiting
+        """
+        self.check_capacity(session)
+        if key is None:
+            with open(input_path, "rb") as f:
+                key = cache_key(hash_stream(f), config)
+
+        job_id = uuid.uuid4().hex[:12]
+        seconds = preview[1] if preview else _probe_seconds(input_path)
+        with self._lock:
+            self._jobs[job_id] = {
+                "id": job_id,
+                "batch": batch,
+                "session": session,
+                "name": Path(input_path).name,
+                "input": str(input_path),
+                "config": config,
+                "key": key,
+                "preview": list(preview) if preview else None,
+                "memory_mb": job_memory_mb(seconds),
+                "status": PENDING,
+                "progress": 0.0,
+                "attempts": 0,
+                "error": None,
+                "stems": {},
+                "log": "",
+                "created": time.time(),
+                "started": None,
+                "finished": None,
+            }
+            self._save()
+        self._enqueue(self._jobs[job_id])
+        self.start()
+        return job_id
+
+    def retry(self, job_id: str) -> None:
+        """Re-queue a failed job
+
+        Raises:
+            QueueFullError: Too many jobs are already waiting
+        """
+        with self._lock:
+            job = self._jobs[job_id]
+            if job["status"] != FAILED:
+                return
+            self.check_capacity(job.get("session"))
+            job.update(status=PENDING, progress=0.0, attempts=0, error=None)
+            self._save()
+        self._enqueue(job)
+        self.start()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job, self._positions()) if job else None
+
+    def jobs(self, batch: str = None) -> List[dict]:
+        """Snapshot of job records, optionally filtered by batch id"""
+        with self._lock:
+            positions = self._positions()
+            return [
+                self._snapshot(job, positions)
+                for job in self._jobs.values()
+                if batch is None or job["batch"] == batch
+            ]
+
+    def _snapshot(self, job: dict, positions: Dict[str, int]) -> dict:
+        """Copy of a job record; pending jobs carry their place in the queue
+        as "position" (1 is next) out of "queued" waiting jobs"""
+        job = copy.deepcopy(job)
+        if job["id"] in positions:
+            job.update(position=positions[job["id"]], queued=len(positions))
+        return job
+
+    def active_job(self, key: str, config: dict, preview: tuple = None) -> Optional[str]:
+        """Id of a pending or running job for the same input and settings, if any
+
+        Args:
+            key: Cache key of the input and separation settings
+            config: Separation config; the export formats must match too,
+                since the cache key leaves them out
+        """
+        preview = list(preview) if preview else None
+        with self._lock:
+            for job in self._jobs.values():
+                if (
+                    job["key"] == key
+                    and job.get("preview") == preview
+                    and job["status"] in (PENDING, RUNNING)
+                    and job["config"]["EXPORT_FORMAT"] == config["EXPORT_FORMAT"]
+                    and job["config"].get("EXTRA_FORMATS") == config.get("EXTRA_FORMATS")
+                ):
+                    return job["id"]
+        return None
+
+    def check_capacity(self, session: str = None) -> None:
+        """Check that a job from `session` would be accepted right now, so
+        callers can turn submissions away before saving their uploads
+
+        Raises:
+            QueueFullError: Too many jobs are already waiting
+        """
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                raise QueueFullError(
+                    f"The processing queue is full ({len(self._pending)} jobs waiting); "
+                    "please try again in a few minutes"
+                )
+            waiting = sum(self._jobs[job_id].get("session") == session for job_id in self._pending)
+            if session is not None and waiting >= self.max_pending_per_session:
+                raise QueueFullError(
+                    f"You already have {waiting} jobs waiting; "
+                    "wait for some of them to finish before submitting more"
+                )
+
+    def _enqueue(self, job: dict) -> None:
+        with self._changed:
+            self._pending.append(job["id"])
+            self._changed.notify_all()
+
+    def _schedule(self) -> List[dict]:
+        """
+        Pending jobs in the order they will be admitted, as (round, job)
+        pairs: previews first, then round robin across sessions, each
+        session's jobs oldest first. A session gets one job per round;
+        sessions that were idle join at the current round instead of
+        catching up on the rounds they missed.
+        """
+        pending = [self._jobs[job_id] for job_id in self._pending]
+        pending.sort(key=lambda job: PREVIEW_PRIORITY if job.get("preview") else DEFAULT_PRIORITY)
+        rounds = {}
+        order = []
+        for index, job in enumerate(pending):
+            session = job.get("session")
+            if session not in rounds:
+                rounds[session] = max(self._session_rounds.get(session, -1) + 1, self._round)
+            priority = PREVIEW_PRIORITY if job.get("preview") else DEFAULT_PRIORITY
+            order.append((priority, rounds[session], index, job))
+            rounds[session] += 1
+        return [(turn, job) for _, turn, _, job in sorted(order, key=lambda item: item[:3])]
+
+    def _positions(self) -> Dict[str, int]:
+        return {job["id"]: position for position, (_, job) in enumerate(self._schedule(), 1)}
+
+    def _admitted_memory_mb(self, admitted: dict = None) -> int:
+        """Estimated memory of admitted jobs, counting each model's weights once"""
+        with self._lock:
+            admitted = self._admitted if admitted is None else admitted
+            models = {model for model, _ in admitted.values()}
+            return sum(memory for _, memory in admitted.values()) + sum(
+                model_memory_mb(model) for model in models
+            )
+
+    def _admit(self) -> Optional[dict]:
+        """Take the next job off the schedule if it fits in the memory budget"""
+        self._pending = [
+            job_id for job_id in self._pending if self._jobs[job_id]["status"] == PENDING
+        ]
+        schedule = self._schedule()
+        if not schedule:
+            return None
+
+        # Only the head is considered, so large jobs are not starved by small ones
+        turn, job = schedule[0]
+        memory = job.get("memory_mb") or job_memory_mb()
+        admitted = {**self._admitted, job["id"]: (job["config"]["MODEL_NAME"], memory)}
+        if self._admitted and self._admitted_memory_mb(admitted) > self.memory_mb:
+            return None
+
+        self._admitted = admitted
+        self._pending.remove(job["id"])
+        self._round = max(self._round, turn)
+        self._session_rounds[job.get("session")] = turn
+        return job
+
+    def _release(self, job: dict) -> None:
+        with self._changed:
+            self._admitted.pop(job["id"], None)
+            self._changed.notify_all()
+
+    def start(self) -> None:
+        """Start the background workers if they are not already running"""
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self) -> None:
+        while True:
+            with self._changed:
+                job = self._admit()
+                while job is None:
+                    self._changed.wait()
+                    job = self._admit()
+                job.update(status=RUNNING, started=time.time(), progress=0.0)
+                job["attempts"] += 1
+                self._save()
+
+            encodes = []
+            rss = PeakRSS()
+            rss.start()
+            try:
+                stems = self._execute(job, encodes)
+            except Exception as e:
+                self._release(job)
+                self._finish(job, {}, e, rss)
+                continue
+            # Encoding runs in the encoder pool; the budget only covers separation
+            self._release(job)
+
+            if encodes:
+                # Stems finish encoding while this worker moves on to the next job
+                separated = time.perf_counter()
+                when_all(encodes).add_done_callback(
+                    lambda done, job=job, stems=stems, rss=rss, separated=separated: self._finish(
+                        job, stems, done.exception(), rss, separated
+                    )
+                )
+            else:
+                self._finish(job, stems, rss=rss)
+
+    def _finish(
+        self,
+        job: dict,
+        stems: Dict[str, Path],
+        error: Exception = None,
+        rss: PeakRSS = None,
+        separated: float = None,
+    ) -> None:
+        """Record the outcome of a job, re-queueing failures with attempts left
+
+        Args:
+            rss: Memory sampler started with the job
+            separated: perf_counter() when separation ended while encodes
+                were still pending
+        """
+        if separated is not None:
+            encode = round(time.perf_counter() - separated, 3)
+            with self._lock:
+                job["timings"] = {**job.get("timings", {}), "encode": encode}
+        peak_rss = rss.stop() if rss else None
+
+        if error is None:
+            with self._lock:
+                job.update(
+                    status=DONE,
+                    progress=1.0,
+                    stems={name: str(path) for name, path in stems.items()},
+                    finished=time.time(),
+                )
+                self._save()
+            self._record_metrics(job, stems, DONE, peak_rss)
+            return
+
+        log_error(error)
+        with self._lock:
+            job["error"] = str(error)
+            if job["attempts"] < self.max_attempts:
+                job["status"] = PENDING
+                self._enqueue(job)
+            else:
+                job.update(status=FAILED, finished=time.time())
+            self._save()
+        retrying = job["status"] == PENDING
+        self._record_metrics(job, {}, "retry" if retrying else FAILED, peak_rss)
+
+    def _record_metrics(
+        self, job: dict, stems: Dict[str, Path], status: str, peak_rss: int = None
+    ) -> None:
+        """Report one finished attempt to the metrics registry and job log"""
+        duration = time.time() - job["started"]
+        phases = dict(job.get("timings") or {})
+        audio_seconds = None
+        if job.get("preview"):
+            audio_seconds = job["preview"][1]
+        elif stems:
+            first_path = Path(next(iter(stems.values())))
+            manifest = read_manifest(first_path.parent.parent / MANIFEST_NAME)
+            if manifest:
+                audio_seconds = manifest["duration"]
+                if manifest["created"] < job["started"]:
+                    # Served from the result cache; only format conversion ran
+                    status = "cached"
+                else:
+                    # Separation phases are timed where the model ran
+                    phases = {**manifest["timings"], **phases}
+
+        input_path = Path(job["input"])
+        metrics.record_job(
+            {
+                "job": job["id"],
+                "kind": "preview" if job.get("preview") else "separation",
+                "status": status,
+                "model": job["config"]["MODEL_NAME"],
+                "device": job["config"]["DEVICE"],
+                "attempt": job["attempts"],
+                "queue_wait": round(job["started"] - job["created"], 3),
+                "duration": round(duration, 3),
+                "phases": phases,
+                "bytes_in": input_path.stat().st_size if input_path.exists() else None,
+                "bytes_out": (
+                    sum(os.path.getsize(path) for path in stems.values() if Path(path).exists())
+                    if status == DONE
+                    else 0
+                ),
+                "audio_seconds": audio_seconds,
+                "rtf": round(duration / audio_seconds, 4) if audio_seconds else None,
+                "peak_rss": peak_rss,
+                "error": job["error"] if status in ("retry", FAILED) else None,
+                "finished": time.time(),
+            }
+        )
+
+    def _execute(self, job: dict, encodes: list) -> Dict[str, Path]:
+        started = time.perf_counter()
+        from audio_processor import run_preview, run_separation
+
+        # torch/demucs are only imported once the first job runs
+        record_startup_metric("heavy_imports", time.perf_counter() - started)
+        replace_tqdm()
+
+        def on_progress(n, total, desc):
+            job["progress"] = min(n / total, 1.0) if total else 0.0
+
+        # Phases are collected privately and published under the lock, since
+        # snapshots deep-copy the job record while it runs
+        timings = {}
+        set_progress_hook(on_progress)
+        set_phase_timings(timings)
+        try:
+            if job.get("preview"):
+                start, duration = job["preview"]
+                return run_preview(
+                    Path(job["input"]), job["config"], job["key"], start, duration
+                )
+            return run_separation(
+                Path(job["input"]),
+                job["config"],
+                key=job["key"],
+                log_container=JobLog(job),
+                encode_futures=encodes,
+            )
+        finally:
+            set_progress_hook(None)
+            set_phase_timings(None)
+            with self._lock:
+                job["timings"] = timings
+
+    def _load(self) -> None:
+        if not self.state_path.exists():
+            return
+        try:
+            jobs = json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+
+        for job in jobs:
+            if isinstance(job["stems"], list):
+                # Records written before stems were keyed by name
+                job["stems"] = {Path(path).stem: path for path in job["stems"]}
+            if job["status"] in (PENDING, RUNNING):
+                job.update(status=PENDING, progress=0.0)
+                self._enqueue(job)
+            self._jobs[job["id"]] = job
+
+    def _save(self) -> None:
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(list(self._jobs.values()), indent=2), encoding="utf-8")
+        tmp_path.replace(self.state_path)
+
+
+job_queue = JobQueue()
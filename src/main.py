@@ -11,109 +11,243 @@ streamlit_config.apply_streamlit_patches()
 
 import sys
 import os
+import multiprocessing
+import time
+import uuid
 from pathlib import Path
 import streamlit as st
 import streamlit.web.cli as stcli
-from config import OUTPUT_DIR
+from config import ALLOWED_EXTENSIONS, JOB_POLL_INTERVAL, MAX_FILE_SIZE_MB
 from frontend.ui import (
     render_header_section,
     render_file_uploader,
-    render_processing_expander,
+    render_batch_mode_toggle,
+    render_folder_input,
+    render_job_status,
+    render_job_progress,
+    render_preview_options,
     render_output,
     config_page,
     render_advanced_config,
 )
-from utils import setup_environment, resolve_path, log_error
-from audio_processor import execute_demucs, process_audio
+from utils import (
+    setup_environment,
+    resolve_path,
+    log_error,
+    save_upload,
+    upload_duration,
+    record_startup_metric,
+)
+from result_cache import result_cache, hash_stream, cache_key
+from job_queue import QueueFullError, job_queue
+from progress import format_timings
+
+
+def discard_upload(input_path: Path) -> None:
+    """Remove an upload that was not queued, and its cache folder if now empty"""
+    input_path.unlink(missing_ok=True)
+    try:
+        input_path.parent.rmdir()
+    except OSError:
+        pass
 
 
+def batch_flow(config: dict):
+    """Queue uploaded files or a folder and render the batch's job status"""
+    uploaded_files = render_file_uploader(batch=True)
+    folder = render_folder_input()
+
+    if st.button("Submit Batch", disabled=not (uploaded_files or folder)):
+        setup_environment()
+        batch = uuid.uuid4().hex[:8]
+        session = st.session_state.session_id
+        rejected = []
+
+        for uploaded_file in uploaded_files or []:
+            try:
+                # Uploads are only saved once the queue can take them
+                job_queue.check_capacity(session)
+            except QueueFullError as e:
+                rejected.append((uploaded_file.name, e))
+                continue
+            key = cache_key(hash_stream(uploaded_file), config)
+            output_dir = result_cache.entry_dir(key)
+            output_dir.mkdir(parents=True, exist_ok=True)
+            input_path = save_upload(uploaded_file, output_dir / uploaded_file.name)
+            try:
+                job_queue.submit(input_path, config, batch=batch, key=key, session=session)
+            except QueueFullError as e:
+                discard_upload(input_path)
+                rejected.append((uploaded_file.name, e))
+
+        if folder:
+            folder_path = Path(folder)
+            if not folder_path.is_dir():
+                st.error(f"Folder not found: {folder}")
+            else:
+                for input_path in sorted(folder_path.iterdir()):
+                    if input_path.suffix.lstrip(".").lower() in ALLOWED_EXTENSIONS:
+                        try:
+                            job_queue.submit(input_path, config, batch=batch, session=session)
+                        except QueueFullError as e:
+                            rejected.append((input_path.name, e))
+
+        if rejected:
+            names = ", ".join(name for name, _ in rejected)
+            st.warning(f"{rejected[-1][1]}. Not queued: {names}")
+        st.session_state.batch = batch
+
+    batch = st.session_state.get("batch")
+    if not batch:
+        return
+
+    job_queue.start()
+    jobs = job_queue.jobs(batch=batch)
+    finished = sum(job["status"] in ("done", "failed") for job in jobs)
+    st.markdown(f"#### Batch progress: {finished}/{len(jobs)} files")
+    for job in jobs:
+        if render_job_status(job):
+            try:
+                job_queue.retry(job["id"])
+            except QueueFullError as e:
+                st.warning(str(e))
+            else:
+                st.rerun()
+
+    # Poll until every job in the batch has settled
+    if finished < len(jobs):
+        time.sleep(JOB_POLL_INTERVAL)
+        st.rerun()
+
+
+def job_flow(job_id: str, preview_job_id: str = None):
+    """Render a background job submitted from this session until it settles"""
+    job = job_queue.get(job_id)
+    if job is None:
+        st.session_state.job_id = None
+        return
+
+    if job["status"] in ("pending", "running"):
+        render_job_progress(job)
+
+        preview = job_queue.get(preview_job_id) if preview_job_id else None
+        if preview and preview["status"] == "done":
+            start, duration = preview["preview"]
+            st.caption(
+                f"Preview of {start:.0f}s–{start + duration:.0f}s while the full track is processing"
+            )
+            render_output(preview["stems"])
+
+        time.sleep(JOB_POLL_INTERVAL)
+        st.rerun()
+    elif job["status"] == "failed":
+        st.error(f"Processing error: {job['error']}")
+        if st.button("Retry"):
+            try:
+                job_queue.retry(job_id)
+            except QueueFullError as e:
+                st.warning(str(e))
+            else:
+                st.rerun()
+    else:
+        if job.get("timings"):
+            st.caption(f"Timings: {format_timings(job['timings'])}")
+        render_output(job["stems"])
+
 
 def main_flow():
     try:
         render_header_section()
+        record_startup_metric("first_paint")
+        # Pick up jobs that were interrupted by a restart
+        job_queue.start()
 
         config = render_advanced_config()
-        uploaded_file = render_file_uploader()
+        if render_batch_mode_toggle():
+            batch_flow(config)
+            return
 
-        # Export Format Configuration
-        export_cfg = config["EXPORT_FORMAT"]
-        format_args = []
-        if export_cfg["format"]:
-            format_args.append(export_cfg["format"])
-            if export_cfg["format"] == "--mp3" and export_cfg["mp3_bitrate"]:
-                format_args += ["--mp3-bitrate", str(export_cfg["mp3_bitrate"])]
-        elif export_cfg["wav_bit_depth"]:
-            if export_cfg["wav_bit_depth"] == 32:
-                format_args.append("--float32")
-            elif export_cfg["wav_bit_depth"] == 24:
-                format_args.append("--int24")
+        uploaded_file = render_file_uploader()
 
         if not uploaded_file:
             return
 
+        preview_region = render_preview_options(upload_duration(uploaded_file))
+
         # Update session state
         if (
             config != st.session_state.config
             or uploaded_file != st.session_state.uploaded_file
         ):
-            st.session_state.submitted = False  # Reset submission on config/file change
+            # Detach from the jobs and cached results on config/file change
+            st.session_state.job_id = None
+            st.session_state.preview_job_id = None
+            st.session_state.cached_stems = None
         st.session_state.config = config
         st.session_state.uploaded_file = uploaded_file
 
         if st.button("Submit for Processing", disabled=not uploaded_file):
-            st.session_state.submitted = True
-
-
-        # Execute only when submitted
-        if st.session_state.submitted and uploaded_file:
-
             try:
                 setup_environment()
 
-                with st.spinner("Processing..."):
-                    output_dir = OUTPUT_DIR / uploaded_file.name
-                    output_dir.mkdir(parents=True, exist_ok=True)
-                    input_path = output_dir / uploaded_file.name
-
-                    if not input_path.exists():
-                        input_path.write_bytes(uploaded_file.getvalue())
-                    output_container = render_processing_expander()
-                    execute_demucs(
-                        [
-                            (
-                                "demucs"
-                                if not getattr(sys, "frozen", False)
-                                else str(Path(sys._MEIPASS) / "demucs.exe")
-                            ),
-                            *config["STEM_MODE"],
-                            "-n", config["MODEL_NAME"],
-                            "-o", str(output_dir),
-                            "--filename", "{stem}.{ext}",
-                            *format_args, "-d",
-                            config["DEVICE"], str(input_path),
-                        ],
-                        output_container,
-                    )
-
-                    # Determine stems based on configuration
-                    if config["STEM_MODE"] and config["STEM_MODE"][0] == "--two-stems":
-                        stems = ["vocals", "no_vocals"]
-                    elif not config["STEM_MODE"] and config["MODEL_NAME"] == "htdemucs_6s":
-                        stems = ["vocals", "drums", "bass", "guitar", "piano", "other"]
+                key = cache_key(hash_stream(uploaded_file), config)
+                # Cached separations only need converting to the chosen format
+                with st.spinner("Checking for previously separated stems..."):
+                    cached_paths = result_cache.export(key, config["EXPORT_FORMAT"])
+                    if cached_paths:
+                        for export_cfg in config["EXTRA_FORMATS"]:
+                            result_cache.export(key, export_cfg)
+                if cached_paths:
+                    st.success("Loaded previously separated stems from cache.")
+                    # Kept in the session like job_id, so they stay up across reruns
+                    st.session_state.cached_stems = cached_paths
+                    st.session_state.job_id = None
+                    st.session_state.preview_job_id = None
+                else:
+                    st.session_state.cached_stems = None
+                    # Re-attach to a job still queued or resuming from a checkpoint
+                    job_id = job_queue.active_job(key, config)
+                    st.session_state.preview_job_id = None
+                    if job_id is None:
+                        session = st.session_state.session_id
+                        # Uploads are only saved once the queue can take them
+                        job_queue.check_capacity(session)
+                        output_dir = result_cache.entry_dir(key)
+                        output_dir.mkdir(parents=True, exist_ok=True)
+                        input_path = save_upload(uploaded_file, output_dir / uploaded_file.name)
+                        try:
+                            job_id = job_queue.submit(input_path, config, key=key, session=session)
+                        except QueueFullError:
+                            discard_upload(input_path)
+                            raise
+                        if preview_region:
+                            try:
+                                st.session_state.preview_job_id = job_queue.submit(
+                                    input_path,
+                                    config,
+                                    key=key,
+                                    preview=preview_region,
+                                    session=session,
+                                )
+                            except QueueFullError:
+                                # The full separation is queued; skip the preview
+                                pass
                     else:
-                        stems = ["vocals", "drums", "bass", "other"]
-
-                    output_paths = process_audio(
-                        config["MODEL_NAME"], output_dir, stems, extension="mp3"
-                    )
-
-                    render_output(output_paths, channels=len(output_paths))
+                        st.info("Continuing the unfinished separation of this file.")
+                    st.session_state.job_id = job_id
 
+            except QueueFullError as e:
+                st.warning(str(e))
             except Exception as e:
                 log_error(e)
                 st.error(f"Processing error: {str(e)}")
                 st.exception(e)
-                st.session_state.submitted = False
+
+        if st.session_state.cached_stems:
+            render_output(st.session_state.cached_stems)
+        # Follow the background job without holding the script thread
+        elif st.session_state.job_id:
+            job_flow(st.session_state.job_id, st.session_state.preview_job_id)
 
     except Exception as e:
         log_error(e)
@@ -126,10 +260,15 @@ def main():
     try:
         # Initialize session state
 
-        if "submitted" not in st.session_state:
-            st.session_state.submitted = False
+        if "job_id" not in st.session_state:
+            st.session_state.job_id = None
+            st.session_state.preview_job_id = None
+            st.session_state.cached_stems = None
             st.session_state.config = {}
             st.session_state.uploaded_file = None
+        if "session_id" not in st.session_state:
+            # Jobs are queued fairly between browser sessions
+            st.session_state.session_id = uuid.uuid4().hex[:12]
 
         # Ensure package metadata is accessible [PyInstaller]
         if getattr(sys, "frozen", False):
@@ -152,6 +291,9 @@ def main():
 
 
 if __name__ == "__main__":
+    # Encoder workers of the frozen build re-run this executable
+    multiprocessing.freeze_support()
+
     if getattr(sys, "frozen", False):
         # Splash Screen
         try:
@@ -171,6 +313,8 @@ if __name__ == "__main__":
                 resolve_path(__file__),
                 "--global.developmentMode=false",
                 "--browser.gatherUsageStats=false",
+                # Reject oversized uploads before Streamlit buffers them
+                f"--server.maxUploadSize={MAX_FILE_SIZE_MB}",
             ]
             sys.exit(stcli.main())
 
@@ -0,0 +1,124 @@
+# SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+_lock = threading.Lock()
+
+
+def write_manifest(path: Path, manifest: dict) -> None:
+    """Atomically write a separation manifest"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    tmp_path.replace(path)
+
+
+def read_manifest(path: Path) -> Optional[dict]:
+    """Load a manifest, or None when it is missing or unreadable"""
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def new_manifest(
+    model: str,
+    source: str,
+    samplerate: int,
+    channels: int,
+    duration: float,
+    intermediates: Dict[str, Path],
+    root: Path,
+    timings: dict = None,
+) -> dict:
+    """
+    Describe one separated track. Paths are stored relative to `root`, the
+    folder holding the manifest, so cache entries can be moved as a whole.
+    """
+    return {
+        "version": MANIFEST_VERSION,
+        "model": model,
+        "source": source,
+        "samplerate": samplerate,
+        "channels": channels,
+        "duration": round(duration, 3),
+        "stems": list(intermediates),
+        "intermediates": {
+            name: path.relative_to(root).as_posix() for name, path in intermediates.items()
+        },
+        "exports": {},
+        "timings": dict(timings or {}),
+        "created": time.time(),
+    }
+
+
+def manifest_stems(path: Path, variant: str = None) -> Optional[Dict[str, Path]]:
+    """
+    Stem paths listed in a manifest, in display order.
+
+    Args:
+        path: Manifest file
+        variant: Export variant (see `encoder.export_variant`); the float32
+            intermediates when omitted
+
+    Returns:
+        Mapping of stem name to path, or None when the manifest or any
+        listed file is missing
+    """
+    manifest = read_manifest(path)
+    if manifest is None:
+        return None
+    if variant is None:
+        files = manifest["intermediates"]
+    elif variant in manifest["exports"]:
+        files = manifest["exports"][variant]["stems"]
+    else:
+        return None
+
+    root = Path(path).parent
+    stems = {name: root / files[name] for name in manifest["stems"] if name in files}
+    if len(stems) != len(manifest["stems"]) or not all(p.exists() for p in stems.values()):
+        return None
+    return stems
+
+
+def manifest_thumbnails(path: Path) -> Dict[str, Path]:
+    """Thumbnail files listed in a manifest, keyed by stem name and mix"""
+    manifest = read_manifest(path) or {}
+    root = Path(path).parent
+    return {name: root / file for name, file in manifest.get("thumbnails", {}).items()}
+
+
+def record_thumbnails(path: Path, thumbnails: Dict[str, Path]) -> None:
+    """Add waveform/spectrogram thumbnails to a manifest"""
+    root = Path(path).parent
+    with _lock:
+        manifest = read_manifest(path)
+        if manifest is None:
+            return
+        manifest["thumbnails"] = {
+            name: Path(p).relative_to(root).as_posix() for name, p in thumbnails.items()
+        }
+        write_manifest(path, manifest)
+
+
+def record_export(path: Path, variant: str, fmt: str, stems: Dict[str, Path]) -> None:
+    """Add a finished format conversion to a manifest"""
+    root = Path(path).parent
+    with _lock:
+        manifest = read_manifest(path)
+        if manifest is None:
+            return
+        manifest["exports"][variant] = {
+            "format": fmt,
+            "stems": {name: Path(p).relative_to(root).as_posix() for name, p in stems.items()},
+        }
+        write_manifest(path, manifest)
@@ -0,0 +1,188 @@
+# SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+import psutil
+from config import METRICS_LOG_PATH, METRICS_LOG_MAX_MB
+
+# Histogram buckets for job durations (seconds) and real-time factors
+SECONDS_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800)
+RTF_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4)
+
+
+class PeakRSS:
+    """Samples the resident set size of this process in a background thread"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._process.memory_info().rss)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self) -> None:
+        self.peak = self._process.memory_info().rss
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> int:
+        self._stop.set()
+        self._thread.join()
+        return self.peak
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def lines(self, name: str, labels: str) -> list:
+        sep = "," if labels else ""
+        lines = [
+            f'{name}_bucket{{{labels}{sep}le="{bound}"}} {count}'
+            for bound, count in zip(self.buckets, self.counts)
+        ]
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+
+
+class MetricsRegistry:
+    """
+    Aggregates per-job metrics for the `/metrics` endpoint and appends every
+    job record to a JSON-lines log for offline capacity planning.
+    """
+
+    def __init__(self, log_path: Path = METRICS_LOG_PATH, max_log_mb: int = METRICS_LOG_MAX_MB):
+        self.log_path = log_path
+        self.max_log_size = max_log_mb * 1024**2
+        self._lock = threading.Lock()
+        self._jobs = defaultdict(int)
+        self._bytes = defaultdict(int)
+        self._audio_seconds = defaultdict(float)
+        self._phases = defaultdict(float)
+        self._durations = defaultdict(lambda: Histogram(SECONDS_BUCKETS))
+        self._queue_wait = defaultdict(lambda: Histogram(SECONDS_BUCKETS))
+        self._rtf = defaultdict(lambda: Histogram(RTF_BUCKETS))
+        self._peak_rss = 0
+        self._gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+    def add_gauge(self, name: str, help_text: str, fn: Callable[[], float]) -> None:
+        """Register a gauge whose value is read at scrape time"""
+        self._gauges[name] = (help_text, fn)
+
+    def record_job(self, record: dict) -> None:
+        """
+        Add one finished job attempt.
+
+        Args:
+            record: Job metrics with "kind", "status", "model", "device",
+                "queue_wait", "duration", "phases", "bytes_in", "bytes_out",
+                "audio_seconds", "rtf" and "peak_rss" (missing values as None)
+        """
+        labels = (record["kind"], record["model"], record["device"])
+        with self._lock:
+            self._jobs[(*labels, record["status"])] += 1
+            self._bytes[(*labels, "in")] += record["bytes_in"] or 0
+            self._bytes[(*labels, "out")] += record["bytes_out"] or 0
+            self._audio_seconds[labels] += record["audio_seconds"] or 0
+            for phase, seconds in record["phases"].items():
+                self._phases[(*labels, phase)] += seconds
+            self._durations[labels].observe(record["duration"])
+            self._queue_wait[labels].observe(record["queue_wait"])
+            if record["rtf"] is not None:
+                self._rtf[labels].observe(record["rtf"])
+            self._peak_rss = max(self._peak_rss, record["peak_rss"] or 0)
+            self._append_log(record)
+
+    def _append_log(self, record: dict) -> None:
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.log_path.exists() and self.log_path.stat().st_size > self.max_log_size:
+            self.log_path.replace(self.log_path.with_suffix(self.log_path.suffix + ".1"))
+        with self.log_path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def render(self) -> str:
+        """Current metrics in the Prometheus text exposition format"""
+        out = []
+
+        def header(name: str, kind: str, help_text: str):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+
+        def split(key):
+            kind, model, device = key[:3]
+            return _labels(kind=kind, model=model, device=device)
+
+        with self._lock:
+            header("sol_jobs_total", "counter", "Finished job attempts by outcome")
+            for key, value in self._jobs.items():
+                out.append(f'sol_jobs_total{{{split(key)},status="{key[3]}"}} {value}')
+
+            header("sol_job_bytes_total", "counter", "Audio bytes read and written")
+            for key, value in self._bytes.items():
+                out.append(f'sol_job_bytes_total{{{split(key)},direction="{key[3]}"}} {value}')
+
+            header("sol_job_audio_seconds_total", "counter", "Seconds of audio processed")
+            for key, value in self._audio_seconds.items():
+                out.append(f"sol_job_audio_seconds_total{{{split(key)}}} {value:.3f}")
+
+            header("sol_job_phase_seconds_total", "counter", "Time spent per processing phase")
+            for key, value in self._phases.items():
+                out.append(
+                    f'sol_job_phase_seconds_total{{{split(key)},phase="{key[3]}"}} {value:.3f}'
+                )
+
+            for name, histograms, help_text in (
+                ("sol_job_duration_seconds", self._durations, "Job run time"),
+                ("sol_job_queue_wait_seconds", self._queue_wait, "Time queued before start"),
+                ("sol_job_realtime_factor", self._rtf, "Processing time per audio second"),
+            ):
+                header(name, "histogram", help_text)
+                for key, histogram in histograms.items():
+                    out += histogram.lines(name, split(key))
+
+            header("sol_job_peak_rss_bytes", "gauge", "Highest resident memory seen during a job")
+            out.append(f"sol_job_peak_rss_bytes {self._peak_rss}")
+
+        header("sol_process_rss_bytes", "gauge", "Current resident memory")
+        out.append(f"sol_process_rss_bytes {psutil.Process().memory_info().rss}")
+        for name, (help_text, fn) in self._gauges.items():
+            header(name, "gauge", help_text)
+            out.append(f"{name} {fn()}")
+        return "\n".join(out) + "\n"
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,149 @@
+# SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+from typing import Optional
+import psutil
+from config import (
+    JOB_WORKERS,
+    JOB_AUDIO_MB_PER_SECOND,
+    MIN_THREADS_PER_WORKER,
+    MODEL_MEMORY_MB,
+    ACTIVATION_MB_PER_SECOND,
+    DEFAULT_SEGMENT_SECONDS,
+    MIN_SEGMENT_SECONDS,
+    PLANNER_RESERVE_MB,
+    THREADS_PER_CHUNK_JOB,
+    STREAMING_MIN_SECONDS,
+    STREAM_SEGMENT_SECONDS,
+    STREAM_OVERLAP_SECONDS,
+)
+
+
+def device_memory_mb(device: str) -> Optional[int]:
+    """Free memory on the target device: VRAM for CUDA, available RAM otherwise.
+    None when the CUDA device cannot be queried."""
+    if device.startswith("cuda"):
+        import torch
+
+        try:
+            free, _ = torch.cuda.mem_get_info(torch.device(device))
+        except (RuntimeError, AssertionError, ValueError):
+            return None
+        return free // 1024**2
+    return psutil.virtual_memory().available // 1024**2
+
+
+def compute_threads(device: str) -> int:
+    """Intra-op threads available to this process"""
+    if device == "cpu":
+        import torch
+
+        return torch.get_num_threads()
+    return os.cpu_count() or 1
+
+
+def supports_segment_override(model_name: str) -> bool:
+    """Transformer models pad every chunk to their training length, so a
+    smaller segment does not reduce their memory use"""
+    return not model_name.startswith("htdemucs")
+
+
+def plan_separation(
+    model_name: str, device: str = "cpu", memory_mb: int = None, threads: int = None
+) -> dict:
+    """
+    Choose segment length and chunk parallelism for a model on a device so
+    the separation fits in memory while keeping the cores busy.
+
+    Returns:
+        Dict with "segment" (seconds, None for the model default), "jobs"
+        (parallel chunks, 0 for sequential) and "threads" (intra-op
+        threads for each chunk)
+    """
+    if memory_mb is None:
+        memory_mb = device_memory_mb(device)
+    if threads is None:
+        threads = compute_threads(device)
+    if memory_mb is None:
+        # Without memory information keep the model defaults
+        return {"segment": None, "jobs": 0, "threads": threads}
+
+    weights_mb = model_memory_mb(model_name)
+    budget_mb = memory_mb - weights_mb - PLANNER_RESERVE_MB
+    chunk_mb = ACTIVATION_MB_PER_SECOND * DEFAULT_SEGMENT_SECONDS
+
+    segment = None
+    if budget_mb < chunk_mb and supports_segment_override(model_name):
+        segment = max(MIN_SEGMENT_SECONDS, int(budget_mb // ACTIVATION_MB_PER_SECOND))
+
+    jobs = 0
+    if device == "cpu":
+        parallel = min(threads // THREADS_PER_CHUNK_JOB, budget_mb // chunk_mb)
+        jobs = int(parallel) if parallel > 1 else 0
+
+    return {"segment": segment, "jobs": jobs, "threads": chunk_threads(jobs, threads)}
+
+
+def chunk_threads(jobs: int, threads: int) -> int:
+    """Intra-op threads for each of `jobs` parallel chunks, so that together
+    they use the cores once instead of every chunk using all of them"""
+    return max(1, threads // jobs) if jobs > 1 else threads
+
+
+def plan_job_slots(memory_mb: int = None, cores: int = None) -> dict:
+    """
+    Concurrency budget of the job queue: one job per MIN_THREADS_PER_WORKER
+    cores (at most JOB_WORKERS) and the RAM left after the reserve, shared
+    by the jobs admitted at any time.
+
+    Returns:
+        Dict with "slots" (concurrent jobs) and "memory_mb"
+    """
+    cores = cores or os.cpu_count() or 1
+    if memory_mb is None:
+        memory_mb = device_memory_mb("cpu")
+    return {
+        "slots": max(1, min(JOB_WORKERS, cores // MIN_THREADS_PER_WORKER)),
+        "memory_mb": max(int(memory_mb) - PLANNER_RESERVE_MB, 0),
+    }
+
+
+def job_memory_mb(seconds: float = None) -> int:
+    """
+    Working memory of one job besides the model weights: the activations
+    of one chunk plus the audio held in RAM. Streamed tracks only hold one
+    segment; tracks of unknown length are assumed to be the longest ones
+    separated in memory.
+    """
+    if seconds is None:
+        seconds = STREAMING_MIN_SECONDS
+    elif seconds > STREAMING_MIN_SECONDS:
+        seconds = STREAM_SEGMENT_SECONDS + 2 * STREAM_OVERLAP_SECONDS
+    chunk_mb = ACTIVATION_MB_PER_SECOND * DEFAULT_SEGMENT_SECONDS
+    return int(chunk_mb + seconds * JOB_AUDIO_MB_PER_SECOND)
+
+
+def model_memory_mb(model_name: str) -> int:
+    """Resident size of a model's weights, assuming the largest for unknown models"""
+    return MODEL_MEMORY_MB.get(model_name, max(MODEL_MEMORY_MB.values()))
+
+
+# Allocation failures reported as plain RuntimeErrors by torch's allocators
+OUT_OF_MEMORY_MESSAGES = (
+    "out of memory",
+    "defaultcpuallocator",
+    "can't allocate memory",
+    "not enough memory",
+)
+
+
+def is_out_of_memory(error: BaseException) -> bool:
+    """True for CPU or CUDA allocation failures"""
+    import torch
+
+    oom_error = getattr(torch, "OutOfMemoryError", torch.cuda.OutOfMemoryError)
+    if isinstance(error, (MemoryError, oom_error)):
+        return True
+    message = str(error).lower()
+    return any(text in message for text in OUT_OF_MEMORY_MESSAGES)
@@ -0,0 +1,62 @@
+# SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from config import UI_FLUSH_INTERVAL
+
+_local = threading.local()
+
+
+def set_progress_hook(hook: Optional[Callable[[int, int, str], None]]) -> None:
+    """
+    Route progress updates raised on the current thread to `hook(n, total, desc)`
+    instead of the Streamlit session containers. Pass None to clear it.
+    """
+    _local.hook = hook
+
+
+def get_progress_hook() -> Optional[Callable[[int, int, str], None]]:
+    return getattr(_local, "hook", None)
+
+
+class RateLimiter:
+    """Lets an action through at most once per `interval` seconds"""
+
+    def __init__(self, interval: float = UI_FLUSH_INTERVAL):
+        self.interval = interval
+        self._last = 0.0
+
+    def ready(self, force: bool = False) -> bool:
+        now = time.monotonic()
+        if force or now - self._last >= self.interval:
+            self._last = now
+            return True
+        return False
+
+
+def set_phase_timings(timings: Optional[Dict[str, float]]) -> None:
+    """Collect `record_phase` durations of the current thread into `timings`"""
+    _local.timings = timings
+
+
+def get_phase_timings() -> Optional[Dict[str, float]]:
+    return getattr(_local, "timings", None)
+
+
+@contextmanager
+def record_phase(name: str):
+    """Time a processing phase and add it to the current thread's timings"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = getattr(_local, "timings", None)
+        if timings is not None:
+            timings[name] = round(timings.get(name, 0.0) + time.perf_counter() - started, 3)
+
+
+def format_timings(timings: Dict[str, float]) -> str:
+    return " | ".join(f"{name}: {seconds:.1f}s" for name, seconds in timings.items())
@@ -0,0 +1,153 @@
+# SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import json
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+from config import OUTPUT_DIR, RESULT_CACHE_MAX_MB
+from encoder import export_stems, export_variant
+from manifest import manifest_stems, read_manifest, record_export
+
+CACHE_VERSION = 3
+HASH_CHUNK_SIZE = 1024 * 1024
+# Settings that change the separated output; device, output format and UI-only
+# options are excluded since formats are converted from the cached intermediates
+CACHE_SETTINGS = ("MODEL_NAME", "STEM_MODE", "SHIFTS", "OVERLAP", "BACKEND")
+
+
+def hash_stream(stream: BinaryIO) -> str:
+    """Hash a binary stream in chunks without materialising it in memory"""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def cache_key(audio_hash: str, config: dict) -> str:
+    """
+    Builds a content-addressed key from the input audio hash and the
+    separation settings that affect the produced stems.
+    """
+    settings = {name: config.get(name) for name in CACHE_SETTINGS}
+    payload = json.dumps(
+        {"version": CACHE_VERSION, "audio": audio_hash, "settings": settings},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _directory_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+class ResultCache:
+    """
+    On-disk index of finished separations. Each entry owns one output
+    directory under `root` holding float32 stem intermediates, their encodes
+    per output format and a manifest describing both; the least recently
+    used entries are deleted once the total size exceeds the budget.
+    """
+
+    def __init__(self, root: Path = OUTPUT_DIR, max_size_mb: int = RESULT_CACHE_MAX_MB):
+        self.root = root
+        self.index_path = root / "index.json"
+        self.max_size = max_size_mb * 1024**2
+        self._lock = threading.Lock()
+
+    def entry_dir(self, key: str) -> Path:
+        return self.root / key
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """Return the manifest of a cached separation, or None on a miss"""
+        with self._lock:
+            index = self._read_index()
+            entry = index.get(key)
+            if entry is None:
+                return None
+
+            manifest_path = self.entry_dir(key) / entry["manifest"]
+            if manifest_stems(manifest_path) is None:
+                del index[key]
+                self._write_index(index)
+                return None
+
+            entry["last_access"] = time.time()
+            self._write_index(index)
+            return manifest_path
+
+    def export(self, key: str, export_cfg: dict) -> Optional[Dict[str, Path]]:
+        """
+        Return cached stems encoded in the format of `export_cfg`, converting
+        them from the intermediates on first request. None on a miss.
+        """
+        manifest_path = self.lookup(key)
+        if manifest_path is None:
+            return None
+
+        variant, ext, _ = export_variant(export_cfg)
+        stems = manifest_stems(manifest_path, variant)
+        if stems is not None:
+            return stems
+
+        samplerate = read_manifest(manifest_path)["samplerate"]
+        stems = export_stems(manifest_stems(manifest_path), samplerate, export_cfg)
+        record_export(manifest_path, variant, ext, stems)
+        with self._lock:
+            index = self._read_index()
+            if key in index:
+                index[key]["size"] = _directory_size(self.entry_dir(key))
+                self._evict(index, keep=key)
+                self._write_index(index)
+        return stems
+
+    def store(self, key: str, manifest_path: Path, source_name: str = "") -> None:
+        """Register a finished separation and evict old entries if over budget"""
+        entry_dir = self.entry_dir(key)
+        if manifest_stems(manifest_path) is None:
+            return
+
+        with self._lock:
+            index = self._read_index()
+            index[key] = {
+                "source": source_name,
+                "manifest": manifest_path.relative_to(entry_dir).as_posix(),
+                "size": _directory_size(entry_dir),
+                "last_access": time.time(),
+            }
+            self._evict(index, keep=key)
+            self._write_index(index)
+
+    def _evict(self, index: dict, keep: str) -> None:
+        total = sum(entry["size"] for entry in index.values())
+        by_age = sorted(index.items(), key=lambda item: item[1]["last_access"])
+        for key, entry in by_age:
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            total -= entry["size"]
+            del index[key]
+
+    def _read_index(self) -> dict:
+        if not self.index_path.exists():
+            return {}
+        try:
+            return json.loads(self.index_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index: dict) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(index, indent=2), encoding="utf-8")
+        tmp_path.replace(self.index_path)
+
+
+result_cache = ResultCache()
@@ -0,0 +1,150 @@
+# SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+from typing import Callable, List, Tuple
+import numpy as np
+import torch
+from config import (
+    SILENCE_THRESHOLD_DB,
+    SILENCE_MIN_SECONDS,
+    SILENCE_PAD_SECONDS,
+    SILENCE_BLOCK_SECONDS,
+    DUPLICATE_SEGMENT_SECONDS,
+)
+
+
+def _silent_runs(silent: np.ndarray) -> List[Tuple[int, int]]:
+    """(start, stop) index pairs of the True runs in a boolean array"""
+    edges = np.flatnonzero(np.diff(np.concatenate([[False], silent, [False]]).astype(np.int8)))
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+
+def _duplicates(
+    wav: torch.Tensor, regions: List[Tuple[int, int]], window: int, threshold: float
+) -> List[Tuple[int, int, int]]:
+    """
+    Windows of `window` frames that exactly repeat an earlier window. The
+    grid of every active region starts at its first sample above the
+    silence threshold, so material repeated after silence (jingles, looped
+    intros, re-used stingers) lines up with its first occurrence.
+    """
+    seen = {}
+    copies = []
+    for start, stop in regions:
+        loud = np.flatnonzero(wav[:, start:stop].abs().amax(0).numpy() > threshold)
+        if not len(loud):
+            continue
+        for offset in range(start + int(loud[0]), stop - window + 1, window):
+            chunk = wav[:, offset : offset + window]
+            digest = hashlib.blake2b(chunk.numpy().tobytes(), digest_size=16).digest()
+            source = seen.setdefault(digest, offset)
+            if source != offset and torch.equal(chunk, wav[:, source : source + window]):
+                copies.append((offset, source, window))
+    return copies
+
+
+def plan_skips(
+    wav: torch.Tensor,
+    samplerate: int,
+    duplicates: bool = False,
+    threshold_db: float = SILENCE_THRESHOLD_DB,
+    min_silence: float = SILENCE_MIN_SECONDS,
+    pad: float = SILENCE_PAD_SECONDS,
+) -> dict:
+    """
+    Find the parts of a mix that do not need the model: silent stretches of
+    at least `min_silence` seconds and, optionally, exact repeats of earlier
+    material. Silence is measured on 10 ms blocks of the channel peak, so
+    the pre-pass costs a single vectorised reduction over the track.
+
+    Args:
+        wav: Mix as a (channels, frames) tensor, before normalisation
+        samplerate: Sample rate of `wav`
+        duplicates: Also look for exactly repeated segments
+        threshold_db: Peak level (dBFS) at or below which audio is silent
+        min_silence: Shortest silent stretch worth skipping, in seconds
+        pad: Audio kept on each side of a skipped stretch as model context
+
+    Returns:
+        Dict with "runs" ((start, stop) frame ranges to separate), "copies"
+        ((start, source, frames) ranges taken from earlier output), "pad"
+        (context frames) and "skipped" (frames not separated)
+    """
+    length = wav.shape[-1]
+    threshold = 10 ** (threshold_db / 20)
+    pad = int(pad * samplerate)
+    block = max(int(SILENCE_BLOCK_SECONDS * samplerate), 1)
+    blocks = -(-length // block)
+
+    peaks = torch.nn.functional.pad(wav.abs().amax(0), (0, blocks * block - length))
+    silent = (peaks.view(blocks, block).amax(1) <= threshold).numpy()
+    min_blocks = max(int(min_silence * samplerate) // block, 1)
+
+    # Shrink every gap by the context pad, except at the ends of the track
+    skips = []
+    for first, last in _silent_runs(silent):
+        if last - first < min_blocks:
+            continue
+        start = first * block + (pad if first else 0)
+        stop = min(last * block, length) - (pad if last < blocks else 0)
+        if stop > start:
+            skips.append((start, stop, None))
+
+    if duplicates:
+        window = int(DUPLICATE_SEGMENT_SECONDS * samplerate)
+        edges = [0, *(bound for start, stop, _ in skips for bound in (start, stop)), length]
+        regions = [(start, stop) for start, stop in zip(edges[::2], edges[1::2]) if stop > start]
+        for offset, source, frames in _duplicates(wav, regions, window, threshold):
+            # Keep context around the repeat; the copy itself needs none
+            if frames > 2 * pad:
+                skips.append((offset + pad, offset + frames - pad, source + pad))
+        skips.sort()
+
+    runs, copies = [], []
+    position = 0
+    for start, stop, source in skips:
+        if start > position:
+            runs.append((position, start))
+        if source is not None:
+            copies.append((start, source, stop - start))
+        position = stop
+    if position < length:
+        runs.append((position, length))
+
+    return {
+        "runs": runs,
+        "copies": copies,
+        "pad": pad,
+        "skipped": sum(stop - start for start, stop, _ in skips),
+    }
+
+
+def separate_active(
+    separate: Callable[[torch.Tensor], torch.Tensor],
+    mix: torch.Tensor,
+    plan: dict,
+    num_sources: int,
+) -> torch.Tensor:
+    """
+    Separate only the runs of a `plan_skips` plan and stitch the stems back
+    at their original positions: skipped silence stays zero and repeats are
+    copied from the output of their first occurrence.
+
+    Args:
+        separate: Maps a (channels, frames) mix to (sources, channels, frames)
+        mix: Model input as a (channels, frames) tensor
+        plan: Result of `plan_skips` for this mix
+        num_sources: Number of stems `separate` returns
+
+    Returns:
+        Tensor of shape (sources, channels, frames)
+    """
+    length = mix.shape[-1]
+    out = mix.new_zeros(num_sources, *mix.shape)
+    for start, stop in plan["runs"]:
+        low, high = max(start - plan["pad"], 0), min(stop + plan["pad"], length)
+        out[..., start:stop] = separate(mix[:, low:high])[..., start - low : stop - low]
+    for start, source, frames in plan["copies"]:
+        out[..., start : start + frames] = out[..., source : source + frames]
+    return out
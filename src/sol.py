@@ -0,0 +1,232 @@
+# SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Headless entry point for Sol. Runs separations from the command line or as
+a Python API without importing Streamlit or the frontend:
+
+    python sol.py song.mp3 album/ -n htdemucs_ft --stems vocals -f wav
+
+    from sol import separate
+    results = separate(["song.mp3"], model="htdemucs", stems="vocals", fmt="mp3")
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Union
+from config import (
+    ALLOWED_EXTENSIONS,
+    APP_NAME,
+    APP_VERSION,
+    DEFAULT_OVERLAP,
+    DEFAULT_SHIFTS,
+    INFERENCE_BACKENDS,
+    MODEL_NAME,
+    OUTPUT_DIR,
+)
+from result_cache import ResultCache
+from utils import setup_environment, log_error
+
+STEM_CHOICES = ("all", "vocals")
+FORMAT_CHOICES = ("mp3", "wav", "flac")
+BIT_DEPTH_CHOICES = (16, 24, 32)
+
+
+def export_config(fmt: str, mp3_bitrate: int = 320, wav_bit_depth: int = 16) -> dict:
+    """Build an EXPORT_FORMAT block for one output format"""
+    return {
+        "format": "--mp3" if fmt == "mp3" else "--flac" if fmt == "flac" else None,
+        "mp3_bitrate": mp3_bitrate if fmt == "mp3" else None,
+        "wav_bit_depth": (
+            {32: "--float32", 24: "--int24"}.get(wav_bit_depth) if fmt == "wav" else None
+        ),
+    }
+
+
+def make_config(
+    model: str = MODEL_NAME[0],
+    stems: str = "all",
+    fmt: str = "mp3",
+    mp3_bitrate: int = 320,
+    wav_bit_depth: int = 16,
+    device: str = None,
+    shifts: int = DEFAULT_SHIFTS,
+    overlap: float = DEFAULT_OVERLAP,
+    auto_tune: bool = True,
+    extra_formats: Iterable[str] = (),
+    backend: str = "float32",
+    compile: bool = False,
+) -> dict:
+    """Build a separation config in the same shape as the advanced config panel"""
+    from audio_processor import get_compute_device
+
+    if stems not in STEM_CHOICES:
+        raise ValueError(f"stems must be one of {STEM_CHOICES}")
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"backend must be one of {INFERENCE_BACKENDS}")
+    if fmt not in FORMAT_CHOICES:
+        raise ValueError(f"fmt must be one of {FORMAT_CHOICES}")
+    extra_formats = sorted(set(extra_formats) - {fmt})
+    if not set(extra_formats) <= set(FORMAT_CHOICES):
+        raise ValueError(f"extra_formats must be among {FORMAT_CHOICES}")
+
+    return {
+        "MODEL_NAME": model,
+        "STEM_MODE": ["--two-stems", "vocals"] if stems == "vocals" else [],
+        "EXPORT_FORMAT": export_config(fmt, mp3_bitrate, wav_bit_depth),
+        "SHIFTS": int(shifts),
+        "OVERLAP": float(overlap),
+        "DEVICE": device or get_compute_device(),
+        "AUTO_TUNE": auto_tune,
+        "BACKEND": backend,
+        "COMPILE": compile,
+        "EXTRA_FORMATS": [
+            export_config(extra, mp3_bitrate, wav_bit_depth) for extra in extra_formats
+        ],
+    }
+
+
+def collect_inputs(paths: Iterable[Union[str, Path]]) -> List[Path]:
+    """Expand files and folders into the list of supported audio files"""
+    inputs = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            inputs += [
+                p
+                for p in sorted(path.iterdir())
+                if p.suffix.lstrip(".").lower() in ALLOWED_EXTENSIONS
+            ]
+        elif path.exists():
+            inputs.append(path)
+        else:
+            raise FileNotFoundError(f"Input not found: {path}")
+    return inputs
+
+
+def separate(
+    paths: Iterable[Union[str, Path]],
+    model: str = MODEL_NAME[0],
+    stems: str = "all",
+    fmt: str = "mp3",
+    output_dir: Union[str, Path] = OUTPUT_DIR,
+    workers: int = 1,
+    **options,
+) -> Dict[Path, Dict[str, Path]]:
+    """
+    Separate audio files or folders of audio files.
+
+    Args:
+        paths: Audio files and/or folders to separate
+        model: Demucs model name
+        stems: "all" for every stem of the model, "vocals" for vocals/no_vocals
+        fmt: Output format, one of mp3, wav or flac
+        output_dir: Root of the content-addressed output layout
+        workers: Parallel worker processes; 0 plans them from cores and RAM
+        **options: mp3_bitrate, wav_bit_depth, device, shifts, overlap,
+            auto_tune, extra_formats
+
+    Returns:
+        Mapping of each input path to its stems (stem name to path)
+    """
+    from audio_processor import run_separation
+    from encoder import wait_all
+
+    setup_environment()
+    config = make_config(model=model, stems=stems, fmt=fmt, **options)
+    cache = ResultCache(Path(output_dir))
+    inputs = collect_inputs(paths)
+
+    if workers == 1 or len(inputs) < 2:
+        # Encoding of each file overlaps the separation of the next one
+        encodes = []
+        results = {
+            input_path: run_separation(input_path, config, cache=cache, encode_futures=encodes)
+            for input_path in inputs
+        }
+        wait_all(encodes)
+        return results
+
+    from worker_pool import WorkerPool, plan_workers
+
+    if workers:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+    else:
+        workers, threads = plan_workers(model, config["DEVICE"])
+    with WorkerPool(min(workers, len(inputs)), threads, cache=cache) as pool:
+        futures = {input_path: pool.submit(input_path, config) for input_path in inputs}
+        return {input_path: future.result() for input_path, future in futures.items()}
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        "sol", description=f"{APP_NAME} {APP_VERSION} - headless stem separation"
+    )
+    parser.add_argument("paths", nargs="+", type=Path, help="Audio files or folders")
+    parser.add_argument("-n", "--model", default=MODEL_NAME[0], help="Demucs model name")
+    parser.add_argument("--stems", choices=STEM_CHOICES, default="all")
+    parser.add_argument("-f", "--format", dest="fmt", choices=FORMAT_CHOICES, default="mp3")
+    parser.add_argument(
+        "--also", dest="extra_formats", action="append", choices=FORMAT_CHOICES, default=[],
+        help="Additionally export stems to this format (converted from the kept "
+        "float32 stems, without re-running the model)",
+    )
+    parser.add_argument("--mp3-bitrate", type=int, default=320)
+    parser.add_argument("--wav-bit-depth", type=int, choices=BIT_DEPTH_CHOICES, default=16)
+    parser.add_argument("-d", "--device", default=None, help="cuda or cpu (auto-detected)")
+    parser.add_argument("--shifts", type=int, default=DEFAULT_SHIFTS)
+    parser.add_argument("--overlap", type=float, default=DEFAULT_OVERLAP)
+    parser.add_argument(
+        "--backend", choices=INFERENCE_BACKENDS, default="float32",
+        help="CPU inference backend (int8: dynamically quantised weights)",
+    )
+    parser.add_argument(
+        "--compile", action="store_true", help="Compile the model graph before separating"
+    )
+    parser.add_argument("-o", "--out", type=Path, default=OUTPUT_DIR, help="Output folder")
+    parser.add_argument(
+        "--no-auto-tune", dest="auto_tune", action="store_false",
+        help="Use model default segment size and sequential chunks",
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=1,
+        help="Parallel worker processes (0 = plan from cores and available RAM)",
+    )
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    args = get_parser().parse_args(argv)
+    try:
+        results = separate(
+            args.paths,
+            model=args.model,
+            stems=args.stems,
+            fmt=args.fmt,
+            output_dir=args.out,
+            workers=args.workers,
+            mp3_bitrate=args.mp3_bitrate,
+            wav_bit_depth=args.wav_bit_depth,
+            device=args.device,
+            shifts=args.shifts,
+            overlap=args.overlap,
+            auto_tune=args.auto_tune,
+            extra_formats=args.extra_formats,
+            backend=args.backend,
+            compile=args.compile,
+        )
+    except Exception as e:
+        log_error(e)
+        print(f"Separation failed: {e}", file=sys.stderr)
+        return 1
+
+    for input_path, stems in results.items():
+        print(input_path)
+        for name, stem_path in stems.items():
+            print(f"  {name}: {stem_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
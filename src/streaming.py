@@ -0,0 +1,338 @@
+# SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Tuple
+import lameenc
+import numpy as np
+import soundfile
+import torch
+from demucs import apply as demucs_apply
+from demucs.apply import apply_model
+from demucs.audio import AudioFile, convert_audio
+from silence import plan_skips, separate_active
+
+
+def track_duration(track: Path) -> float:
+    """Duration of a track in seconds, probed without decoding it"""
+    try:
+        return soundfile.info(str(track)).duration
+    except RuntimeError:
+        return AudioFile(track).duration
+
+
+def read_segment(
+    track: Path, start: int, frames: int, samplerate: int, channels: int
+) -> torch.Tensor:
+    """
+    Decode `frames` samples (at `samplerate`) starting at sample `start`.
+    Reads only the requested region; the result is zero padded at the end
+    of the track.
+    """
+    try:
+        with soundfile.SoundFile(str(track)) as f:
+            ratio = f.samplerate / samplerate
+            f.seek(min(int(start * ratio), f.frames))
+            data = f.read(int(frames * ratio) + 1, dtype="float32", always_2d=True)
+            wav = convert_audio(torch.from_numpy(data.T.copy()), f.samplerate, samplerate, channels)
+    except RuntimeError:
+        wav = AudioFile(track).read(
+            seek_time=start / samplerate,
+            duration=frames / samplerate,
+            streams=0,
+            samplerate=samplerate,
+            channels=channels,
+        )
+
+    wav = wav[:, :frames]
+    if wav.shape[1] < frames:
+        wav = torch.nn.functional.pad(wav, (0, frames - wav.shape[1]))
+    return wav
+
+
+def iter_segments(
+    track: Path,
+    length: int,
+    segment: int,
+    overlap: int,
+    samplerate: int,
+    channels: int,
+    start: int = 0,
+) -> Iterator[Tuple[int, torch.Tensor]]:
+    """Yield (offset, waveform) for overlapping segments covering `length` samples,
+    beginning with the segment at offset `start`"""
+    stride = segment - overlap
+    for offset in range(start, max(length - overlap, 1), stride):
+        frames = min(segment, length - offset)
+        yield offset, read_segment(track, offset, frames, samplerate, channels)
+
+
+def track_statistics(
+    track: Path, length: int, segment: int, samplerate: int, channels: int
+) -> Tuple[float, float]:
+    """Mean and standard deviation of the mono mix, accumulated segment by segment"""
+    total, total_sq, count = 0.0, 0.0, 0
+    for _, wav in iter_segments(track, length, segment, 0, samplerate, channels):
+        ref = wav.mean(0).double()
+        total += ref.sum().item()
+        total_sq += (ref**2).sum().item()
+        count += ref.numel()
+    mean = total / max(count, 1)
+    std = max(total_sq / max(count, 1) - mean**2, 0.0) ** 0.5
+    return mean, std or 1.0
+
+
+class StemWriter:
+    """
+    Incremental encoder for one stem. WAV and FLAC are appended through
+    libsndfile, MP3 through a persistent LAME encoder. Samples are clamped
+    since whole-track rescaling is not possible while streaming.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        samplerate: int,
+        channels: int,
+        bitrate: int = 320,
+        preset: int = 2,
+        bits_per_sample: int = 16,
+        as_float: bool = False,
+    ):
+        self.path = path
+        self.mp3 = path.suffix.lower() == ".mp3"
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        if self.mp3:
+            self.encoder = lameenc.Encoder()
+            self.encoder.set_bit_rate(bitrate)
+            self.encoder.set_in_sample_rate(samplerate)
+            self.encoder.set_channels(channels)
+            self.encoder.set_quality(preset)
+            self.encoder.silence()
+            self.file = open(path, "wb")
+        else:
+            if as_float and path.suffix.lower() == ".wav":
+                subtype = "FLOAT"
+            else:
+                subtype = "PCM_24" if bits_per_sample == 24 else "PCM_16"
+            self.file = soundfile.SoundFile(
+                str(path), "w", samplerate=samplerate, channels=channels, subtype=subtype
+            )
+
+    def write(self, wav: torch.Tensor) -> None:
+        frames = wav.clamp(-1, 1).t().contiguous().cpu().numpy()
+        if self.mp3:
+            self.file.write(self.encoder.encode((frames * (2**15 - 1)).astype("<i2").tobytes()))
+        else:
+            self.file.write(frames)
+
+    def close(self) -> None:
+        if self.mp3:
+            self.file.write(self.encoder.flush())
+        self.file.close()
+
+
+class IntermediateWriter:
+    """
+    Incremental writer for a float32 stem intermediate: a memory-mapped .npy
+    array of shape (frames, channels), filled segment by segment.
+    """
+
+    def __init__(self, path: Path, length: int, channels: int, offset: int = 0):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if offset:
+            # Resuming: keep the frames written before the checkpoint
+            self.array = np.lib.format.open_memmap(str(path), mode="r+")
+            if self.array.shape != (length, channels) or self.array.dtype != np.float32:
+                raise ValueError(f"{path.name} does not match its checkpoint")
+        else:
+            self.array = np.lib.format.open_memmap(
+                str(path), mode="w+", dtype=np.float32, shape=(length, channels)
+            )
+        self.offset = offset
+
+    def write(self, wav: torch.Tensor) -> None:
+        frames = wav.t().cpu().numpy()[: len(self.array) - self.offset]
+        self.array[self.offset : self.offset + len(frames)] = frames
+        self.offset += len(frames)
+
+    def flush(self) -> None:
+        self.array.flush()
+
+    def close(self) -> None:
+        self.array.flush()
+        del self.array
+
+
+def save_checkpoint(path: Path, fingerprint: str, state: dict) -> None:
+    """
+    Atomically record streaming progress: the next segment offset, the
+    normalisation statistics and the cross-fade tail of every output.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            fingerprint=np.array(fingerprint),
+            offset=np.array(state["offset"]),
+            mean=np.array(state["mean"]),
+            std=np.array(state["std"]),
+            **{f"tail_{name}": tail.cpu().numpy() for name, tail in state["tails"].items()},
+        )
+        f.flush()
+        os.fsync(f.fileno())
+    tmp_path.replace(path)
+
+
+def load_checkpoint(path: Path, fingerprint: str) -> Optional[dict]:
+    """Streaming progress saved by `save_checkpoint`, or None when missing or stale"""
+    try:
+        with np.load(path) as data:
+            if str(data["fingerprint"]) != fingerprint:
+                return None
+            return {
+                "offset": int(data["offset"]),
+                "mean": float(data["mean"]),
+                "std": float(data["std"]),
+                "tails": {
+                    key[len("tail_"):]: torch.from_numpy(data[key])
+                    for key in data.files
+                    if key.startswith("tail_")
+                },
+            }
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def separate_streaming(
+    model,
+    track: Path,
+    outputs: Dict[Path, str],
+    segment_seconds: float,
+    overlap_seconds: float,
+    writer_kwargs: dict,
+    skip_silence: bool = False,
+    skip_duplicates: bool = False,
+    checkpoint: Path = None,
+    apply: Callable = apply_model,
+    **apply_kwargs,
+) -> None:
+    """
+    Separate a long track segment by segment with bounded memory. Each
+    segment is separated independently, consecutive segments are linearly
+    cross-faded over their overlap and every stem is written incrementally,
+    so peak memory depends on the segment size rather than the track length.
+
+    Args:
+        model: Loaded separation model
+        track: Input audio path
+        outputs: Stem name per output path, so one stem can be written in
+            several formats (".npy" paths receive float32 intermediates);
+            "no_<stem>" entries receive the mix minus that stem
+        segment_seconds: Length of each separated segment
+        overlap_seconds: Cross-fade length between consecutive segments
+        writer_kwargs: Encoding options passed to `StemWriter`
+        skip_silence: Only separate the non-silent regions of each segment
+        skip_duplicates: Also reuse output for exact repeats within a segment
+        checkpoint: Progress file updated after every segment. A matching
+            checkpoint is resumed from, and it is removed once the track is
+            done. Every output must then be a ".npy" intermediate, since
+            encoded streams cannot be reopened mid-way
+        apply: Called as apply(model, mix, **apply_kwargs) for every
+            segment, e.g. to add an out-of-memory fallback to `apply_model`
+        **apply_kwargs: Options forwarded to `apply`
+    """
+    samplerate, channels = model.samplerate, model.audio_channels
+    length = int(track_duration(track) * samplerate)
+    segment = int(segment_seconds * samplerate)
+    overlap = min(int(overlap_seconds * samplerate), segment // 2)
+    settings = (track.name, length, segment, overlap, samplerate, *model.sources)
+    fingerprint = "|".join(map(str, (*settings, *outputs.values())))
+    state = None
+    if checkpoint is not None:
+        if any(path.suffix != ".npy" for path in outputs):
+            raise ValueError("Checkpointed streaming only writes .npy intermediates")
+        state = load_checkpoint(checkpoint, fingerprint)
+        if state is not None:
+            print(f"Resuming from {state['offset'] / samplerate:.0f}s")
+
+    if state is not None:
+        mean, std, start = state["mean"], state["std"], state["offset"]
+    else:
+        mean, std = track_statistics(track, length, segment, samplerate, channels)
+        start = 0
+
+    fade_in = torch.linspace(0, 1, overlap) if overlap else None
+    writers = {
+        path: (
+            IntermediateWriter(path, length, channels, offset=start)
+            if path.suffix == ".npy"
+            else StemWriter(path, samplerate, channels, **writer_kwargs)
+        )
+        for path in outputs
+    }
+    tails = {}
+    if state is not None:
+        tails = {
+            path: state["tails"][name] for path, name in outputs.items() if name in state["tails"]
+        }
+    offsets = range(0, max(length - overlap, 1), segment - overlap)
+
+    try:
+        with demucs_apply.tqdm.tqdm(
+            total=len(offsets), initial=offsets.index(start), unit="segments"
+        ) as progress:
+            for offset, wav in iter_segments(
+                track, length, segment, overlap, samplerate, channels, start
+            ):
+                plan = plan_skips(wav, samplerate, skip_duplicates) if skip_silence else None
+                mix = (wav - mean) / std
+                if plan and plan["skipped"]:
+                    sources = separate_active(
+                        lambda part: apply(model, part[None], **apply_kwargs)[0],
+                        mix,
+                        plan,
+                        len(model.sources),
+                    )
+                else:
+                    sources = apply(model, mix[None], **apply_kwargs)[0]
+                sources = dict(zip(model.sources, sources * std + mean))
+                is_last = offset + segment >= length
+
+                for path, writer in writers.items():
+                    name = outputs[path]
+                    if name.startswith("no_"):
+                        out = wav - sources[name[len("no_"):]]
+                    else:
+                        out = sources[name]
+
+                    if path in tails:
+                        head = out[:, :overlap]
+                        out = out.clone()
+                        out[:, :overlap] = tails[path] * (1 - fade_in) + head * fade_in
+                    if is_last or not overlap:
+                        writer.write(out)
+                    else:
+                        writer.write(out[:, :-overlap])
+                        tails[path] = out[:, -overlap:]
+
+                if checkpoint is not None and not is_last:
+                    for writer in writers.values():
+                        writer.flush()
+                    state = {
+                        "offset": offset + segment - overlap,
+                        "mean": mean,
+                        "std": std,
+                        "tails": {outputs[path]: tail for path, tail in tails.items()},
+                    }
+                    save_checkpoint(checkpoint, fingerprint, state)
+                progress.update(1)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    if checkpoint is not None:
+        checkpoint.unlink(missing_ok=True)
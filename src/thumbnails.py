@@ -0,0 +1,137 @@
+# SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
+# SPDX-License-Identifier: Apache-2.0
+
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+from config import (
+    THUMB_BINS,
+    THUMB_SPEC_FRAMES,
+    THUMB_SPEC_BANDS,
+    THUMB_FFT_SIZE,
+    THUMB_DB_RANGE,
+    DECODE_CHUNK_FRAMES,
+)
+
+# Dark-to-bright ramp used to colour spectrogram thumbnails
+SPECTROGRAM_COLORS = np.array(
+    [[12, 7, 35], [84, 20, 110], [182, 55, 84], [246, 132, 36], [252, 253, 191]],
+    dtype=np.float32,
+)
+
+
+def _mono(intermediates: List[np.ndarray], start: int, stop: int) -> np.ndarray:
+    """Mono sum of one or more (frames, channels) arrays over [start, stop)"""
+    return sum(array[start:stop].mean(axis=1) for array in intermediates)
+
+
+def envelope(intermediates: List[np.ndarray], bins: int = THUMB_BINS):
+    """
+    Peak and RMS envelope of the mono sum, reduced to `bins` points. Read in
+    blocks of whole bins so memory-mapped input is never fully loaded.
+
+    Returns:
+        Tuple of (peaks, rms) float16 arrays of length `bins`
+    """
+    length = len(intermediates[0])
+    size = max(-(-length // bins), 1)
+    bins = -(-length // size)
+    peaks = np.zeros(bins, dtype=np.float32)
+    sums = np.zeros(bins, dtype=np.float64)
+
+    block = max(DECODE_CHUNK_FRAMES // size, 1) * size
+    for start in range(0, length, block):
+        mono = _mono(intermediates, start, min(start + block, length))
+        mono = np.pad(mono, (0, -len(mono) % size)).reshape(-1, size)
+        first = start // size
+        peaks[first : first + len(mono)] = np.abs(mono).max(axis=1)
+        sums[first : first + len(mono)] = np.square(mono, dtype=np.float64).sum(axis=1)
+
+    counts = np.full(bins, size, dtype=np.float64)
+    counts[-1] = length - size * (bins - 1)
+    rms = np.sqrt(sums / counts)
+    return peaks.astype(np.float16), rms.astype(np.float16)
+
+
+def spectrogram(
+    intermediates: List[np.ndarray],
+    frames: int = THUMB_SPEC_FRAMES,
+    bands: int = THUMB_SPEC_BANDS,
+    fft_size: int = THUMB_FFT_SIZE,
+) -> np.ndarray:
+    """
+    Downsampled log-frequency spectrogram of the mono sum. Windows are taken
+    at `frames` evenly spaced positions instead of a full STFT, which is
+    plenty for a thumbnail and reads only a small part of the track.
+
+    Returns:
+        uint8 array of shape (bands, frames), 0 = -THUMB_DB_RANGE dB or below
+    """
+    length = len(intermediates[0])
+    starts = np.linspace(0, max(length - fft_size, 0), frames).astype(np.int64)
+    index = np.minimum(starts[:, None] + np.arange(fft_size), length - 1)
+    windows = sum(np.asarray(array[index.ravel()]).mean(axis=1) for array in intermediates)
+    windows = windows.reshape(frames, fft_size) * np.hanning(fft_size)
+
+    power = np.abs(np.fft.rfft(windows, axis=1)) ** 2
+    edges = np.unique(np.geomspace(1, power.shape[1] - 1, bands + 1).astype(np.int64))
+    banded = np.add.reduceat(power, edges[:-1], axis=1) / np.diff(edges)
+
+    db = 10 * np.log10(banded + 1e-12)
+    db = np.clip(db - db.max(), -THUMB_DB_RANGE, 0)
+    scaled = (db + THUMB_DB_RANGE) / THUMB_DB_RANGE * 255
+    return scaled.T[::-1].astype(np.uint8)
+
+
+def compute_thumbnails(intermediates: Dict[str, Path], out_dir: Path) -> Dict[str, Path]:
+    """
+    Compute envelope and spectrogram thumbnails for every stem and for the
+    mix (the sum of all stems) from float32 intermediates, saved as
+    compressed .npz files.
+
+    Returns:
+        Mapping of stem name (and "mix") to thumbnail path
+    """
+    arrays = {name: np.load(path, mmap_mode="r") for name, path in intermediates.items()}
+    sources = {name: [array] for name, array in arrays.items()}
+    sources["mix"] = list(arrays.values())
+
+    thumbnails = {}
+    for name, source in sources.items():
+        peaks, rms = envelope(source)
+        path = out_dir / f"{name}.thumb.npz"
+        np.savez_compressed(path, peaks=peaks, rms=rms, spectrogram=spectrogram(source))
+        thumbnails[name] = path
+    return thumbnails
+
+
+def load_thumbnail(path: Path) -> Dict[str, np.ndarray]:
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def envelope_svg(peaks: np.ndarray, rms: np.ndarray, width: int = 600, height: int = 64) -> str:
+    """Mirrored waveform thumbnail: peaks in a light tone, RMS on top"""
+    x = np.linspace(0, width, len(peaks))
+    mid = height / 2
+
+    def polygon(values: np.ndarray) -> str:
+        values = np.clip(values.astype(np.float32), 0, 1) * mid
+        top = np.stack([x, mid - values], axis=1)
+        bottom = np.stack([x, mid + values], axis=1)[::-1]
+        return " ".join(f"{px:.1f},{py:.1f}" for px, py in np.concatenate([top, bottom]))
+
+    return (
+        f'<svg viewBox="0 0 {width} {height}" width="100%" height="{height}" '
+        f'preserveAspectRatio="none" xmlns="http://www.w3.org/2000/svg">'
+        f'<polygon points="{polygon(peaks)}" fill="rgba(151, 166, 195, 0.5)"/>'
+        f'<polygon points="{polygon(rms)}" fill="rgba(246, 132, 36, 0.9)"/>'
+        f"</svg>"
+    )
+
+
+def spectrogram_image(spec: np.ndarray) -> np.ndarray:
+    """Colour a uint8 spectrogram thumbnail into an RGB image array"""
+    stops = np.linspace(0, 255, len(SPECTROGRAM_COLORS))
+    rgb = [np.interp(spec, stops, SPECTROGRAM_COLORS[:, c]) for c in range(3)]
+    return np.stack(rgb, axis=-1).astype(np.uint8)
@@ -2,12 +2,31 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import os
+import ctypes
+import shutil
 from datetime import datetime
+from functools import lru_cache
 import traceback
 import time
 from pathlib import Path
-import streamlit as st
-from config import CACHE_DIR, OUTPUT_DIR
+from typing import Optional
+import soundfile
+from config import CACHE_DIR, OUTPUT_DIR, MAX_FILE_SIZE_MB, UPLOAD_CHUNK_SIZE
+from progress import get_progress_hook, RateLimiter
+
+
+# Process start reference for startup metrics (first import happens at launch)
+PROCESS_START = time.perf_counter()
+startup_metrics = {}
+
+
+def record_startup_metric(name: str, seconds: float = None) -> None:
+    """Record a startup metric once; defaults to seconds since process start"""
+    if name not in startup_metrics:
+        if seconds is None:
+            seconds = time.perf_counter() - PROCESS_START
+        startup_metrics[name] = round(seconds, 3)
+        print(f"[startup] {name}: {startup_metrics[name]:.2f}s")
 
 
 def log_error(exc: Exception):
@@ -25,40 +44,31 @@ def log_error(exc: Exception):
 
 
 class StreamlitTqdm:
+    """
+    tqdm stand-in that reports progress to the current thread's progress
+    hook (set by the job queue for background jobs); without a hook it
+    stays silent.
+    """
+
     def __init__(
-        self, iterable=None, total=None, disable=False, desc=None, unit=None, **kwargs
+        self, iterable=None, total=None, disable=False, desc=None, initial=0, **kwargs
     ):
         self.iterable = iterable
         self.total = total or (len(iterable) if iterable else 100)
         self.disable = disable
-        self.n = 0
-        self.start_time = time.time()
+        self.n = initial
         self.desc = desc or "Processing"
-        self.unit = unit or "it"
-
-        # Get containers from session state
-        self.progress_container = st.session_state.get("progress_bar")
-        self.text_container = st.session_state.get("progress_text")
-
-        if not self.progress_container or not self.text_container:
-            raise ValueError("Progress containers not initialized")
+        self.limiter = RateLimiter()
+        self.hook = get_progress_hook()
 
     def update(self, n=1):
-        if self.disable:
+        if self.disable or not self.hook:
             return
 
         self.n += n
-        elapsed = time.time() - self.start_time
-        progress = self.n / self.total if self.total else 0
-        eta = (elapsed / (progress) - elapsed) if progress > 0 else 0
-
-        self.progress_container.progress(progress)
-        self.text_container.text(
-            f"{self.desc}: {int(progress*100)}% | "
-            f"Elapsed: {elapsed:.1f}s | "
-            f"ETA: {eta:.1f}s | "
-            f"{self.unit}/s: {self.n/(elapsed+1e-8):.1f}"
-        )
+        # Only push to the UI every UI_FLUSH_INTERVAL, and always on completion
+        if self.limiter.ready(force=self.n >= self.total):
+            self.hook(self.n, self.total, self.desc)
 
     def __iter__(self):
         if self.iterable is None:
@@ -75,8 +85,27 @@ class StreamlitTqdm:
         pass
 
 
+@lru_cache(maxsize=None)
+def cuda_driver_available() -> bool:
+    """Detect a CUDA device through the driver API without importing torch"""
+    names = ["nvcuda.dll"] if os.name == "nt" else ["libcuda.so.1", "libcuda.so"]
+    for name in names:
+        try:
+            cuda = ctypes.CDLL(name)
+        except OSError:
+            continue
+        count = ctypes.c_int(0)
+        return (
+            cuda.cuInit(0) == 0
+            and cuda.cuDeviceGetCount(ctypes.byref(count)) == 0
+            and count.value > 0
+        )
+    return False
+
+
+@lru_cache(maxsize=None)
 def replace_tqdm():
-    """Apply custom patch to tqdm"""
+    """Apply custom patch to tqdm (once per process)"""
     from demucs import apply, repo
 
     apply.tqdm.tqdm = StreamlitTqdm
@@ -87,8 +116,45 @@ def resolve_path(path: str) -> str:
     return os.path.abspath(os.path.join(os.getcwd(), path))
 
 
+def save_upload(uploaded_file, path: Path, max_size_mb: int = MAX_FILE_SIZE_MB) -> Path:
+    """
+    Stream an uploaded file to disk in chunks, rejecting oversized uploads
+    before anything is copied. Writes to a temporary file first so a partial
+    copy never looks like a finished input.
+    """
+    if uploaded_file.size > max_size_mb * 1024**2:
+        raise ValueError(
+            f"{uploaded_file.name} is {uploaded_file.size / 1024**2:.0f}MB; "
+            f"the limit is {max_size_mb}MB"
+        )
+    if path.exists():
+        return path
+
+    tmp_path = path.with_name(path.name + ".part")
+    uploaded_file.seek(0)
+    with open(tmp_path, "wb") as f:
+        shutil.copyfileobj(uploaded_file, f, UPLOAD_CHUNK_SIZE)
+    uploaded_file.seek(0)
+    tmp_path.replace(path)
+    return path
+
+
+def upload_duration(uploaded_file) -> Optional[float]:
+    """Length of an uploaded track in seconds from its header, or None if unreadable"""
+    try:
+        uploaded_file.seek(0)
+        return soundfile.info(uploaded_file).duration
+    except RuntimeError:
+        return None
+    finally:
+        uploaded_file.seek(0)
+
+
+@lru_cache(maxsize=None)
 def load_js(file_name: str = "main.js") -> str:
     """Load JavaScript content from file and wrap in <script> tags"""
+    import streamlit as st
+
     js_dir = Path(__file__).parent / "frontend/scripts"
     js_file = js_dir / file_name
 
@@ -102,8 +168,11 @@ def load_js(file_name: str = "main.js") -> str:
     return f"<script>\n{js_content}\n</script>"
 
 
+@lru_cache(maxsize=None)
 def load_css(file_name: str = "main.css") -> str:
     """Load CSS content from file and wrap in <style> tags"""
+    import streamlit as st
+
     css_dir = Path(__file__).parent / "frontend/styles"
     css_file = css_dir / file_name
 
@@ -0,0 +1,127 @@
+# SPDX-FileCopyrightText: 2025 Peyman Farahani (@PFarahani)
+# SPDX-License-Identifier: Apache-2.0
+
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Tuple
+from config import (
+    MODEL_MEMORY_MB,
+    WORKER_OVERHEAD_MB,
+    MIN_THREADS_PER_WORKER,
+)
+from planner import device_memory_mb
+from result_cache import ResultCache, result_cache, hash_stream, cache_key
+
+
+def plan_workers(
+    model_name: str, device: str = "cpu", cores: int = None, available_mb: int = None
+) -> Tuple[int, int]:
+    """
+    Choose the number of worker processes and intra-op threads per worker
+    from the core count and available RAM. Each worker holds its own copy
+    of the model plus the working memory of one track.
+
+    Returns:
+        Tuple of (workers, threads_per_worker)
+    """
+    cores = cores or os.cpu_count() or 1
+    if device != "cpu":
+        return 1, cores
+
+    if available_mb is None:
+        available_mb = device_memory_mb(device)
+    per_worker_mb = MODEL_MEMORY_MB.get(model_name, max(MODEL_MEMORY_MB.values()))
+    per_worker_mb += WORKER_OVERHEAD_MB
+
+    workers = min(cores // MIN_THREADS_PER_WORKER, available_mb // per_worker_mb)
+    workers = max(1, int(workers))
+    return workers, max(1, cores // workers)
+
+
+def _init_worker(threads: int) -> None:
+    import torch
+    from encoder import encoder_pool
+    from utils import setup_environment
+
+    setup_environment()
+    # Workers already run in parallel; encode inline instead of nesting pools
+    encoder_pool.set_workers(0)
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+
+def _separate_in_worker(input_path: str, config: dict, output_dir: str) -> str:
+    from audio_processor import record_exports, separate_to_intermediates
+
+    manifest_path = separate_to_intermediates(Path(input_path), config, Path(output_dir))
+    record_exports(manifest_path, config)
+    return str(manifest_path)
+
+
+class WorkerPool:
+    """
+    Runs separations in parallel worker processes. Models stay warm in each
+    worker's own model pool; cache lookups and index updates happen in the
+    parent so the on-disk index has a single writer.
+    """
+
+    def __init__(self, workers: int, threads: int, cache: ResultCache = result_cache):
+        self.workers = workers
+        self.threads = threads
+        self.cache = cache
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(threads,),
+        )
+
+    @classmethod
+    def for_model(cls, model_name: str, device: str = "cpu", **kwargs) -> "WorkerPool":
+        """Create a pool sized by `plan_workers` for a model and device"""
+        workers, threads = plan_workers(model_name, device)
+        return cls(workers, threads, **kwargs)
+
+    def submit(self, input_path: Path, config: dict, key: str = None) -> Future:
+        """Schedule one separation; resolves to a mapping of stem name to path"""
+        if key is None:
+            with open(input_path, "rb") as f:
+                key = cache_key(hash_stream(f), config)
+
+        cached_paths = self.cache.export(key, config["EXPORT_FORMAT"])
+        if cached_paths:
+            future = Future()
+            future.set_result(cached_paths)
+            return future
+
+        output_dir = self.cache.entry_dir(key)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        worker_future = self._executor.submit(
+            _separate_in_worker, str(input_path), config, str(output_dir)
+        )
+
+        future = Future()
+
+        def on_done(done: Future):
+            # Always resolve the caller's future, or it would wait forever
+            try:
+                manifest_path = Path(done.result())
+                self.cache.store(key, manifest_path, source_name=Path(input_path).name)
+                # The worker already encoded the configured format
+                future.set_result(self.cache.export(key, config["EXPORT_FORMAT"]))
+            except Exception as e:
+                future.set_exception(e)
+
+        worker_future.add_done_callback(on_done)
+        return future
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()